@@ -18,6 +18,7 @@ Per evitare sovraccarico del server WFS, questi test usano:
 import sys
 import time
 import unittest
+import urllib.parse
 import urllib.request
 import urllib.error
 from xml.etree import ElementTree as ET
@@ -41,6 +42,10 @@ TEST_MAX_LON = 15.984
 
 TIMEOUT_SEC = 30   # timeout per ogni richiesta HTTP
 
+# Proprietà geometrica usata dal plugin nel filtro FES (identica al plugin)
+WFS_CAMPO_GEOMETRIA = "geometry"
+GML_ID = "{http://www.opengis.net/gml/3.2}id"
+
 
 def _fetch_url(url, timeout=TIMEOUT_SEC):
     """Scarica una URL e restituisce il contenuto testuale."""
@@ -49,6 +54,34 @@ def _fetch_url(url, timeout=TIMEOUT_SEC):
         return resp.read().decode("utf-8", errors="replace")
 
 
+def _filtro_fes_intersects(anello):
+    """
+    Filtro FES 2.0 <Intersects> con il poligono `anello` [(lon, lat), ...]
+    (anello chiuso, EPSG:6706), da passare nel parametro FILTER di GetFeature.
+    Le coordinate GML seguono l'ordine assi dell'URN EPSG:6706 (lat lon).
+    """
+    pos_list = " ".join(f"{lat:.7f} {lon:.7f}" for lon, lat in anello)
+    return (
+        '<fes:Filter xmlns:fes="http://www.opengis.net/fes/2.0" '
+        'xmlns:gml="http://www.opengis.net/gml/3.2">'
+        f"<fes:Intersects><fes:ValueReference>{WFS_CAMPO_GEOMETRIA}</fes:ValueReference>"
+        '<gml:Polygon gml:id="filtro" srsName="urn:ogc:def:crs:EPSG::6706">'
+        f"<gml:exterior><gml:LinearRing><gml:posList>{pos_list}</gml:posList>"
+        "</gml:LinearRing></gml:exterior></gml:Polygon>"
+        "</fes:Intersects></fes:Filter>"
+    )
+
+
+def _id_particelle(content):
+    """Insieme dei gml:id delle CadastralParcel nella risposta GetFeature."""
+    radice = ET.fromstring(content)
+    return {
+        elem.get(GML_ID)
+        for elem in radice.iter()
+        if elem.tag.rsplit("}", 1)[-1] == "CadastralParcel"
+    }
+
+
 # ---------------------------------------------------------------------------
 # Test Cases
 # ---------------------------------------------------------------------------
@@ -225,6 +258,66 @@ class TestWfsGetFeature(unittest.TestCase):
                         "L'URL WFS deve usare HTTPS")
 
 
+class TestWfsFiltroFes(unittest.TestCase):
+    """
+    Verifica il filtro spaziale FES usato dal plugin per linee e punti
+    (proprietà geometrica e ordine assi lat lon): un <Intersects> con il
+    rettangolo dell'area di test deve restituire le stesse particelle della
+    richiesta per bbox.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        base = (
+            f"{WFS_BASE_URL}?service=WFS&request=GetFeature&version=2.0.0"
+            "&typeNames=CP:CadastralParcel"
+        )
+        bbox_str = (
+            f"{TEST_MIN_LAT},{TEST_MIN_LON},{TEST_MAX_LAT},{TEST_MAX_LON},"
+            "urn:ogc:def:crs:EPSG::6706"
+        )
+        anello = [
+            (TEST_MIN_LON, TEST_MIN_LAT), (TEST_MAX_LON, TEST_MIN_LAT),
+            (TEST_MAX_LON, TEST_MAX_LAT), (TEST_MIN_LON, TEST_MAX_LAT),
+            (TEST_MIN_LON, TEST_MIN_LAT),
+        ]
+        filtro = urllib.parse.quote(_filtro_fes_intersects(anello), safe="")
+        try:
+            cls.content_bbox = _fetch_url(f"{base}&bbox={bbox_str}")
+            cls.content_filtro = _fetch_url(f"{base}&filter={filtro}")
+            cls.available = True
+        except Exception as e:
+            cls.content_bbox = cls.content_filtro = ""
+            cls.available = False
+            cls.error = str(e)
+
+    def test_servizio_raggiungibile(self):
+        if not self.available:
+            self.fail(f"WFS GetFeature con filtro non raggiungibile: {self.error}")
+
+    def test_filtro_accettato(self):
+        """Il server accetta il filtro FES (nessun ExceptionReport)."""
+        if not self.available:
+            self.skipTest("WFS non raggiungibile")
+        self.assertNotIn(
+            "ExceptionReport", self.content_filtro,
+            "WFS ha rifiutato il filtro FES <Intersects>"
+        )
+
+    def test_stesse_particelle_del_bbox(self):
+        """Filtro e bbox sullo stesso rettangolo restituiscono gli stessi gml:id."""
+        if not self.available:
+            self.skipTest("WFS non raggiungibile")
+        id_bbox = _id_particelle(self.content_bbox)
+        id_filtro = _id_particelle(self.content_filtro)
+        self.assertTrue(id_bbox, "Nessuna particella nella richiesta per bbox")
+        self.assertEqual(
+            id_filtro, id_bbox,
+            "Il filtro FES non restituisce le particelle del bbox "
+            "(proprietà geometrica o ordine assi errati?)"
+        )
+
+
 class TestWmsGetCapabilities(unittest.TestCase):
     """Verifica che il servizio WMS risponda a GetCapabilities."""
 
@@ -288,6 +381,7 @@ if __name__ == "__main__":
     suite = unittest.TestSuite()
     suite.addTests(loader.loadTestsFromTestCase(TestWfsGetCapabilities))
     suite.addTests(loader.loadTestsFromTestCase(TestWfsGetFeature))
+    suite.addTests(loader.loadTestsFromTestCase(TestWfsFiltroFes))
     suite.addTests(loader.loadTestsFromTestCase(TestWmsGetCapabilities))
 
     runner = unittest.TextTestRunner(verbosity=2)
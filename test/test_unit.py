@@ -10,10 +10,16 @@ Eseguire con:
     python test/test_unit.py
 """
 
+import email.utils
+import io
 import math
 import re
 import sys
+import threading
+import time
 import unittest
+import urllib.parse
+from xml.etree import ElementTree
 
 # ---------------------------------------------------------------------------
 # Funzioni copiate 1:1 dal plugin (wfs_catasto_download_particelle_bbox_p.py)
@@ -63,14 +69,16 @@ def calcola_griglia_tile(min_lat, min_lon, max_lat, max_lon, max_tile_km2):
     delta_lat = (max_lat - min_lat) / n_rows
     delta_lon = (max_lon - min_lon) / n_cols
 
-    tiles = []
-    for r in range(n_rows):
-        for c in range(n_cols):
-            t_min_lat = min_lat + r * delta_lat
-            t_max_lat = min_lat + (r + 1) * delta_lat
-            t_min_lon = min_lon + c * delta_lon
-            t_max_lon = min_lon + (c + 1) * delta_lon
-            tiles.append((t_min_lat, t_min_lon, t_max_lat, t_max_lon))
+    # Bordi della griglia calcolati una volta sola (n+1 valori per asse)
+    # (come linspace: l'ultimo bordo è esattamente il massimo, senza errori
+    # di arrotondamento che lascerebbero una striscia scoperta)
+    bordi_lat = [min_lat + r * delta_lat for r in range(n_rows)] + [max_lat]
+    bordi_lon = [min_lon + c * delta_lon for c in range(n_cols)] + [max_lon]
+    tiles = [
+        (bordi_lat[r], bordi_lon[c], bordi_lat[r + 1], bordi_lon[c + 1])
+        for r in range(n_rows)
+        for c in range(n_cols)
+    ]
 
     return tiles
 
@@ -108,6 +116,244 @@ def _parse_nationalcadastralreference(ref):
     return result
 
 
+# CCCC Z FFFF A S: comune, sezione, foglio, allegato, sviluppo (prima del punto)
+_NCR_RE = re.compile(r"[^.]{4}([^.])([^.]{4})([^.])([^.])(?:\.|$)")
+
+
+def _espandi_ncr(ncr):
+    """
+    Scompone NATIONALCADASTRALREFERENCE (formato CCCCZFFFFAS.particella) in
+    (sezione, foglio, allegato, sviluppo) con un'unica regex precompilata.
+    Restituisce None se il codice non ha il formato atteso.
+    """
+    m = _NCR_RE.match(ncr or "")
+    if m is None:
+        return None
+    sez, foglio, allegato, sviluppo = m.groups()
+    return (
+        "" if sez == "_" else sez,
+        int(foglio) if foglio.isdigit() else None,
+        allegato,
+        sviluppo,
+    )
+
+
+def _leggi_radice_gml(dati):
+    """
+    Restituisce (nome locale, attributi) dell'elemento radice del GML (bytes),
+    analizzando il documento in streaming solo fino al primo tag.
+    ('', {}) se il contenuto non è XML valido: la lettura viene lasciata a OGR.
+    """
+    try:
+        for _evento, elem in ElementTree.iterparse(io.BytesIO(dati), events=("start",)):
+            return elem.tag.rsplit("}", 1)[-1], dict(elem.attrib)
+    except ElementTree.ParseError:
+        pass
+    return "", {}
+
+
+WFS_CAMPO_GEOMETRIA = "geometry"
+
+
+def _filtro_fes_intersects(anello):
+    """
+    Filtro FES 2.0 <Intersects> con il poligono `anello` [(lon, lat), ...]
+    (anello chiuso, EPSG:6706), da passare nel parametro FILTER di GetFeature.
+    Le coordinate GML seguono l'ordine assi dell'URN EPSG:6706 (lat lon).
+    """
+    pos_list = " ".join(f"{lat:.7f} {lon:.7f}" for lon, lat in anello)
+    return (
+        '<fes:Filter xmlns:fes="http://www.opengis.net/fes/2.0" '
+        'xmlns:gml="http://www.opengis.net/gml/3.2">'
+        f"<fes:Intersects><fes:ValueReference>{WFS_CAMPO_GEOMETRIA}</fes:ValueReference>"
+        '<gml:Polygon gml:id="filtro" srsName="urn:ogc:def:crs:EPSG::6706">'
+        f"<gml:exterior><gml:LinearRing><gml:posList>{pos_list}</gml:posList>"
+        "</gml:LinearRing></gml:exterior></gml:Polygon>"
+        "</fes:Intersects></fes:Filter>"
+    )
+
+
+def _secondi_retry_after(valore):
+    """
+    Secondi di attesa indicati dall'intestazione Retry-After (numero di secondi
+    o data HTTP), oppure None se assente o non interpretabile.
+    """
+    if not valore:
+        return None
+    valore = valore.strip()
+    if valore.isdigit():
+        return float(valore)
+    try:
+        data = email.utils.parsedate_to_datetime(valore)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, data.timestamp() - time.time())
+
+
+WFS_BASE_URL = (
+    "https://wfs.cartografia.agenziaentrate.gov.it/inspire/wfs/owfs01.php?"
+    "service=WFS&request=GetFeature&version=2.0.0"
+    "&typeNames=CP:CadastralParcel"
+)
+PAUSA_MAX_SECONDI = 60
+TENTATIVI_TILE = 4
+TILE_VUOTO = b""
+_FILTRO_SERVER_RIFIUTATO = threading.Event()
+
+
+class _ErroreHttp(OSError):
+    """
+    Risposta HTTP diversa da 200; lo stato resta disponibile in `status` e
+    l'attesa chiesta dal server (Retry-After, in secondi) in `retry_after`.
+    """
+
+    def __init__(self, status, reason, retry_after=None):
+        super().__init__(f"HTTP {status} {reason}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class _LimitatoreRichieste:
+    """
+    Distanzia l'avvio delle richieste WFS di almeno `intervallo` secondi,
+    anche quando i download procedono in parallelo (thread-safe).
+    L'intervallo si adatta al server: raddoppia quando risponde 429/503
+    (fino a PAUSA_MAX_SECONDI) e torna verso il valore base dopo alcune
+    risposte corrette consecutive.
+    """
+
+    SUCCESSI_PER_ACCELERARE = 3
+
+    def __init__(self, intervallo):
+        self._intervallo_base = intervallo
+        self._intervallo = intervallo
+        self._successi = 0
+        self._lock = threading.Lock()
+        self._prossimo_avvio = 0.0
+        self._annullato = threading.Event()
+
+    def attendi_turno(self):
+        """Blocca fino al prossimo slot libero. Restituisce False se annullato."""
+        with self._lock:
+            avvio = max(time.monotonic(), self._prossimo_avvio)
+            self._prossimo_avvio = avvio + self._intervallo
+        attesa = max(0.0, avvio - time.monotonic())
+        return not self._annullato.wait(attesa)
+
+    def rallenta(self, retry_after=None):
+        """
+        Il server è sotto carico: raddoppia l'intervallo e sposta il prossimo avvio.
+        Se il server ha indicato un Retry-After, il prossimo avvio lo rispetta
+        (limitato a PAUSA_MAX_SECONDI).
+        """
+        with self._lock:
+            self._intervallo = min(self._intervallo * 2, PAUSA_MAX_SECONDI)
+            self._successi = 0
+            attesa = self._intervallo
+            if retry_after is not None:
+                attesa = max(attesa, min(retry_after, PAUSA_MAX_SECONDI))
+            self._prossimo_avvio = max(self._prossimo_avvio, time.monotonic() + attesa)
+            intervallo = self._intervallo
+        print(f"  [WFS] Server sotto carico: pausa tra le richieste portata a {intervallo:.0f} sec")
+
+    def registra_successo(self):
+        with self._lock:
+            if self._intervallo <= self._intervallo_base:
+                return
+            self._successi += 1
+            if self._successi >= self.SUCCESSI_PER_ACCELERARE:
+                self._intervallo = max(self._intervallo / 2, self._intervallo_base)
+                self._successi = 0
+
+    def annulla(self):
+        self._annullato.set()
+
+
+# Risposte simulate del server: sostituisce il _scarica_url del plugin (rete)
+# e consuma una risposta (bytes o eccezione) per ogni richiesta
+_RISPOSTE_FINTE = []
+_URL_RICHIESTI = []
+
+
+def _scarica_url(url, fout):
+    _URL_RICHIESTI.append(url)
+    risposta = _RISPOSTE_FINTE.pop(0)
+    if isinstance(risposta, Exception):
+        raise risposta
+    fout.write(risposta)
+
+
+def _scarica_tile(min_lat, min_lon, max_lat, max_lon, limitatore=None, filtro=None):
+    """
+    Scarica in memoria la risposta GML di un tile WFS (solo rete).
+    Non usa oggetti QGIS: può essere eseguita in un thread di lavoro.
+    Se è indicato un _LimitatoreRichieste, gli segnala l'esito (429/503 o successo)
+    e, dopo un 429/503, riprova lo stesso tile fino a TENTATIVI_TILE volte.
+    Con `filtro` (XML FES) la richiesta usa FILTER al posto di BBOX; se il server
+    lo rifiuta, il tile viene richiesto di nuovo per bbox. Anche un tile filtrato
+    vuoto viene ricontrollato per bbox: proprietà geometrica e ordine assi del
+    filtro non sono verificati sul server, che potrebbe accettarlo senza applicarlo.
+    Restituisce i byte del GML, TILE_VUOTO se il server non ha
+    restituito feature, oppure None in caso di errore.
+    """
+    if filtro is not None and not _FILTRO_SERVER_RIFIUTATO.is_set():
+        wfs_url = f"{WFS_BASE_URL}&filter={urllib.parse.quote(filtro, safe='')}"
+    else:
+        filtro = None
+        bbox_str = f"{min_lat},{min_lon},{max_lat},{max_lon},urn:ogc:def:crs:EPSG::6706"
+        wfs_url = f"{WFS_BASE_URL}&bbox={bbox_str}"
+
+    filtro_vuoto = False
+    for tentativo in range(1, TENTATIVI_TILE + 1):
+        try:
+            buffer = io.BytesIO()
+            _scarica_url(wfs_url, buffer)
+            dati = buffer.getvalue()
+            if limitatore is not None:
+                limitatore.registra_successo()
+
+            # Verifica errori / tile vuoto leggendo solo l'elemento radice
+            radice, attributi = _leggi_radice_gml(dati)
+            if radice == "ExceptionReport":
+                if filtro is None:
+                    print("  [ERRORE] Il server ha restituito un errore per questo tile")
+                    return None
+                break
+            elif radice == "FeatureCollection" and attributi.get("numberReturned") == "0":
+                if filtro is None:
+                    return TILE_VUOTO
+                filtro_vuoto = True
+                break
+            else:
+                return dati
+
+        except Exception as e:
+            stato = getattr(e, "status", None)
+            if filtro is not None and stato == 400:
+                break
+            if limitatore is not None and stato in (429, 503):
+                # Server sotto carico: pausa più lunga e nuovo tentativo dello stesso tile
+                limitatore.rallenta(getattr(e, "retry_after", None))
+                if tentativo < TENTATIVI_TILE:
+                    print(f"  [WFS] Tile rifiutato (HTTP {stato}): "
+                          f"nuovo tentativo {tentativo + 1}/{TENTATIVI_TILE}")
+                    if not limitatore.attendi_turno():
+                        return None
+                    continue
+            print(f"  [ERRORE] Download tile fallito: {e}")
+            return None
+
+    # Uscita dal ciclo solo con il filtro FES: rifiutato dal server (da qui in
+    # poi solo bbox) oppure tile filtrato vuoto (ricontrollato per bbox)
+    if not filtro_vuoto and not _FILTRO_SERVER_RIFIUTATO.is_set():
+        _FILTRO_SERVER_RIFIUTATO.set()
+        print("  [WFS] Filtro spaziale non accettato dal server: uso la richiesta per bbox")
+    if limitatore is not None and not limitatore.attendi_turno():
+        return None
+    return _scarica_tile(min_lat, min_lon, max_lat, max_lon, limitatore)
+
+
+
 # ---------------------------------------------------------------------------
 # Test Cases
 # ---------------------------------------------------------------------------
@@ -243,6 +489,25 @@ class TestCalcolaGrigliaTile(unittest.TestCase):
         # Il numero di tile × area_max deve coprire l'area totale
         self.assertGreaterEqual(len(tiles) * MAX_TILE_KM2, area_totale)
 
+    def test_ultimo_bordo_esatto(self):
+        """L'ultima riga/colonna termina esattamente sul bordo del bbox."""
+        min_lat, min_lon, max_lat, max_lon = 41.1, 12.3, 41.7, 13.1
+        tiles = calcola_griglia_tile(min_lat, min_lon, max_lat, max_lon, 0.7)
+        self.assertEqual(max(t[2] for t in tiles), max_lat)
+        self.assertEqual(max(t[3] for t in tiles), max_lon)
+        self.assertEqual(min(t[0] for t in tiles), min_lat)
+        self.assertEqual(min(t[1] for t in tiles), min_lon)
+
+    def test_tile_adiacenti_condividono_bordi(self):
+        """Tile contigui hanno bordi identici (nessun buco o sovrapposizione)."""
+        tiles = calcola_griglia_tile(41.0, 12.0, 42.0, 13.0, MAX_TILE_KM2)
+        n_cols = sum(1 for t in tiles if t[0] == tiles[0][0])
+        for i, tile in enumerate(tiles):
+            if (i + 1) % n_cols:
+                self.assertEqual(tile[3], tiles[i + 1][1])
+            if i + n_cols < len(tiles):
+                self.assertEqual(tile[2], tiles[i + n_cols][0])
+
 
 class TestParseNationalCadastralReference(unittest.TestCase):
     """
@@ -322,6 +587,28 @@ class TestParseNationalCadastralReference(unittest.TestCase):
         self.assertEqual(r["sviluppo"], "0")
 
 
+class TestEspandiNcr(unittest.TestCase):
+    """Test della scomposizione usata per i campi sezione/foglio/allegato/sviluppo."""
+
+    def test_senza_sezione(self):
+        self.assertEqual(_espandi_ncr("G273_001200.45"), ("", 12, "0", "0"))
+
+    def test_sezione_e_allegato(self):
+        self.assertEqual(_espandi_ncr("H501A0012BC.7"), ("A", 12, "B", "C"))
+
+    def test_foglio_non_numerico(self):
+        self.assertEqual(_espandi_ncr("G273_00X200.45"), ("", None, "0", "0"))
+
+    def test_senza_particella(self):
+        self.assertEqual(_espandi_ncr("G273_001200"), ("", 12, "0", "0"))
+
+    def test_formato_non_valido(self):
+        self.assertIsNone(_espandi_ncr("G273_0012.45"))
+        self.assertIsNone(_espandi_ncr("G273_0012000.45"))
+        self.assertIsNone(_espandi_ncr(""))
+        self.assertIsNone(_espandi_ncr(None))
+
+
 class TestWfsUrlSecurity(unittest.TestCase):
     """Test che la validazione URL del plugin sia corretta."""
 
@@ -375,6 +662,148 @@ class TestWfsUrlSecurity(unittest.TestCase):
         self.assertLess(min_lon_url, max_lon_url)
 
 
+class TestLeggiRadiceGml(unittest.TestCase):
+    """Test del controllo sull'elemento radice della risposta WFS."""
+
+    def test_exception_report(self):
+        dati = (
+            b'<?xml version="1.0"?>'
+            b'<ows:ExceptionReport xmlns:ows="http://www.opengis.net/ows/1.1">'
+            b'<ows:Exception exceptionCode="InvalidParameterValue"/>'
+            b'</ows:ExceptionReport>'
+        )
+        radice, _attributi = _leggi_radice_gml(dati)
+        self.assertEqual(radice, "ExceptionReport")
+
+    def test_feature_collection_vuota(self):
+        dati = (
+            b'<?xml version="1.0"?>'
+            b'<wfs:FeatureCollection xmlns:wfs="http://www.opengis.net/wfs/2.0" '
+            b'numberMatched="0" numberReturned="0"/>'
+        )
+        radice, attributi = _leggi_radice_gml(dati)
+        self.assertEqual(radice, "FeatureCollection")
+        self.assertEqual(attributi.get("numberReturned"), "0")
+
+    def test_contenuto_non_xml(self):
+        self.assertEqual(_leggi_radice_gml(b"risposta non valida"), ("", {}))
+
+
+class TestFiltroFesIntersects(unittest.TestCase):
+    """Test del filtro spaziale FES inviato al server al posto del bbox."""
+
+    FES = "{http://www.opengis.net/fes/2.0}"
+    GML = "{http://www.opengis.net/gml/3.2}"
+    ANELLO = [(12.5, 41.9), (12.6, 41.9), (12.6, 42.0), (12.5, 41.9)]
+
+    def test_xml_valido(self):
+        radice = ElementTree.fromstring(_filtro_fes_intersects(self.ANELLO))
+        self.assertEqual(radice.tag, f"{self.FES}Filter")
+        intersects = radice.find(f"{self.FES}Intersects")
+        self.assertIsNotNone(intersects)
+        self.assertEqual(
+            intersects.findtext(f"{self.FES}ValueReference"), WFS_CAMPO_GEOMETRIA
+        )
+
+    def test_ordine_assi_lat_lon(self):
+        radice = ElementTree.fromstring(_filtro_fes_intersects(self.ANELLO))
+        pos_list = radice.find(f".//{self.GML}posList").text.split()
+        self.assertEqual(len(pos_list), 2 * len(self.ANELLO))
+        self.assertAlmostEqual(float(pos_list[0]), 41.9)   # lat
+        self.assertAlmostEqual(float(pos_list[1]), 12.5)   # lon
+
+    def test_crs_urn(self):
+        radice = ElementTree.fromstring(_filtro_fes_intersects(self.ANELLO))
+        poligono = radice.find(f".//{self.GML}Polygon")
+        self.assertEqual(poligono.get("srsName"), "urn:ogc:def:crs:EPSG::6706")
+
+
+class TestSecondiRetryAfter(unittest.TestCase):
+    """Test dell'interpretazione di Retry-After nelle risposte 429/503."""
+
+    def test_secondi(self):
+        self.assertEqual(_secondi_retry_after("120"), 120.0)
+        self.assertEqual(_secondi_retry_after(" 5 "), 5.0)
+
+    def test_data_http(self):
+        futuro = email.utils.formatdate(time.time() + 30, usegmt=True)
+        self.assertAlmostEqual(_secondi_retry_after(futuro), 30, delta=2)
+
+    def test_data_passata(self):
+        passato = email.utils.formatdate(time.time() - 60, usegmt=True)
+        self.assertEqual(_secondi_retry_after(passato), 0.0)
+
+    def test_assente_o_non_valido(self):
+        self.assertIsNone(_secondi_retry_after(None))
+        self.assertIsNone(_secondi_retry_after(""))
+        self.assertIsNone(_secondi_retry_after("domani"))
+
+
+class TestScaricaTileRiprova(unittest.TestCase):
+    """Test dei nuovi tentativi di _scarica_tile quando il server risponde 429/503."""
+
+    GML = (
+        b'<?xml version="1.0"?>'
+        b'<wfs:FeatureCollection xmlns:wfs="http://www.opengis.net/wfs/2.0" '
+        b'numberMatched="1" numberReturned="1"/>'
+    )
+    TILE = (41.9, 12.5, 41.91, 12.51)
+    ANELLO = [(12.5, 41.9), (12.51, 41.9), (12.51, 41.91), (12.5, 41.9)]
+
+    def setUp(self):
+        _RISPOSTE_FINTE.clear()
+        _URL_RICHIESTI.clear()
+        _FILTRO_SERVER_RIFIUTATO.clear()
+        self.limitatore = _LimitatoreRichieste(0)
+
+    def test_429_poi_200(self):
+        _RISPOSTE_FINTE.extend([_ErroreHttp(429, "Too Many Requests"), self.GML])
+        dati = _scarica_tile(*self.TILE, limitatore=self.limitatore)
+        self.assertEqual(dati, self.GML)
+        self.assertEqual(_RISPOSTE_FINTE, [])
+
+    def test_tentativi_esauriti(self):
+        _RISPOSTE_FINTE.extend(
+            [_ErroreHttp(503, "Service Unavailable")] * TENTATIVI_TILE + [self.GML]
+        )
+        self.assertIsNone(_scarica_tile(*self.TILE, limitatore=self.limitatore))
+        self.assertEqual(_RISPOSTE_FINTE, [self.GML])
+
+    def test_altri_errori_senza_nuovo_tentativo(self):
+        _RISPOSTE_FINTE.extend([_ErroreHttp(500, "Internal Server Error"), self.GML])
+        self.assertIsNone(_scarica_tile(*self.TILE, limitatore=self.limitatore))
+        self.assertEqual(_RISPOSTE_FINTE, [self.GML])
+
+    def test_annullato_durante_attesa(self):
+        _RISPOSTE_FINTE.extend([_ErroreHttp(429, "Too Many Requests"), self.GML])
+        self.limitatore.annulla()
+        self.assertIsNone(_scarica_tile(*self.TILE, limitatore=self.limitatore))
+        self.assertEqual(_RISPOSTE_FINTE, [self.GML])
+
+    def test_filtro_vuoto_ricontrollato_per_bbox(self):
+        vuoto = (
+            b'<?xml version="1.0"?>'
+            b'<wfs:FeatureCollection xmlns:wfs="http://www.opengis.net/wfs/2.0" '
+            b'numberMatched="0" numberReturned="0"/>'
+        )
+        _RISPOSTE_FINTE.extend([vuoto, self.GML])
+        filtro = _filtro_fes_intersects(self.ANELLO)
+        dati = _scarica_tile(*self.TILE, limitatore=self.limitatore, filtro=filtro)
+        self.assertEqual(dati, self.GML)
+        self.assertIn("&filter=", _URL_RICHIESTI[0])
+        self.assertIn("&bbox=", _URL_RICHIESTI[1])
+        # Il filtro resta attivo per i tile successivi
+        self.assertFalse(_FILTRO_SERVER_RIFIUTATO.is_set())
+
+    def test_filtro_rifiutato_passa_al_bbox(self):
+        _RISPOSTE_FINTE.extend([_ErroreHttp(400, "Bad Request"), self.GML])
+        filtro = _filtro_fes_intersects(self.ANELLO)
+        dati = _scarica_tile(*self.TILE, limitatore=self.limitatore, filtro=filtro)
+        self.assertEqual(dati, self.GML)
+        self.assertIn("&bbox=", _URL_RICHIESTI[1])
+        self.assertTrue(_FILTRO_SERVER_RIFIUTATO.is_set())
+
+
 class TestConfigurazionePlugin(unittest.TestCase):
     """Test delle costanti di configurazione del plugin."""
 
@@ -410,7 +839,12 @@ if __name__ == "__main__":
     suite.addTests(loader.loadTestsFromTestCase(TestDeterminaUtmEpsg))
     suite.addTests(loader.loadTestsFromTestCase(TestCalcolaGrigliaTile))
     suite.addTests(loader.loadTestsFromTestCase(TestParseNationalCadastralReference))
+    suite.addTests(loader.loadTestsFromTestCase(TestEspandiNcr))
     suite.addTests(loader.loadTestsFromTestCase(TestWfsUrlSecurity))
+    suite.addTests(loader.loadTestsFromTestCase(TestLeggiRadiceGml))
+    suite.addTests(loader.loadTestsFromTestCase(TestFiltroFesIntersects))
+    suite.addTests(loader.loadTestsFromTestCase(TestSecondiRetryAfter))
+    suite.addTests(loader.loadTestsFromTestCase(TestScaricaTileRiprova))
     suite.addTests(loader.loadTestsFromTestCase(TestConfigurazionePlugin))
 
     runner = unittest.TextTestRunner(verbosity=2)
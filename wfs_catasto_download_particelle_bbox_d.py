@@ -11,7 +11,7 @@ import os
 import webbrowser
 
 from qgis.core import QgsProject, QgsVectorLayer
-from qgis.PyQt.QtCore import Qt
+from qgis.PyQt.QtCore import Qt, pyqtSlot
 from qgis.PyQt.QtGui import QFont, QPixmap
 from qgis.PyQt.QtWidgets import (
     QComboBox,
@@ -37,6 +37,20 @@ _RichText = Qt.TextFormat.RichText
 _KeepAspectRatio = Qt.AspectRatioMode.KeepAspectRatio
 _SmoothTransformation = Qt.TransformationMode.SmoothTransformation
 
+# Font dei titoli, creati alla prima richiesta (serve una QApplication attiva)
+_FONT_CACHE = {}
+
+
+def _font_titolo(punti):
+    """Restituisce il QFont grassetto della dimensione indicata, condiviso tra i dialog."""
+    font = _FONT_CACHE.get(punti)
+    if font is None:
+        font = QFont()
+        font.setPointSize(punti)
+        font.setBold(True)
+        _FONT_CACHE[punti] = font
+    return font
+
 
 def _is_point_layer(layer):
     return layer.geometryType() == Qgis.GeometryType.Point
@@ -76,10 +90,7 @@ class AvvisoDialog(QDialog):
 
         # Icona e titolo
         titolo = QLabel("\u26a0  AVVISO IMPORTANTE")
-        font_titolo = QFont()
-        font_titolo.setPointSize(16)
-        font_titolo.setBold(True)
-        titolo.setFont(font_titolo)
+        titolo.setFont(_font_titolo(16))
         titolo.setAlignment(_AlignCenter)
         titolo.setStyleSheet("color: #D32F2F;")
         layout.addWidget(titolo)
@@ -170,11 +181,35 @@ class AvvisoDialog(QDialog):
 class SceltaModalitaDialog(QDialog):
     """Finestra di dialogo per scegliere la modalità di definizione dell'area."""
 
-    # Stile comune per i QGroupBox delle celle
-    _CELL_STYLE = (
-        "QGroupBox { font-weight: bold; border: 1px solid #ccc; "
-        "border-radius: 5px; margin-top: 10px; padding-top: 15px; }"
-        "QGroupBox::title { subcontrol-origin: margin; left: 10px; }"
+    # Colori (normale, hover) dei pulsanti, per objectName
+    _BTN_COLORI = {
+        "btnDisegna": ("#2962FF", "#1E4FD0"),
+        "btnPoligono": ("#00897B", "#006B5E"),
+        "btnLinea": ("#F57F17", "#E65100"),
+        "btnPunti": ("#7B1FA2", "#6A1B9A"),
+        "btnChiudi": ("#D32F2F", "#B71C1C"),
+        "btnGuida": ("#4CAF50", "#45a049"),
+    }
+
+    # Un solo foglio di stile per tutto il dialog, applicato in _init_ui:
+    # Qt lo analizza una volta invece di uno per widget. Selettori per
+    # objectName, così non si propaga ai dialog figli (es. QMessageBox)
+    _QSS = (
+        "QFrame#sepTitolo { border: none; border-top: 2px solid #aaa; }"
+        "QFrame#sep { color: #ccc; }"
+        "QFrame#sepRiga { color: #ddd; }"
+        "QPushButton#" + ", QPushButton#".join(_BTN_COLORI) + " { color: white; "
+        "font-size: 11px; font-weight: bold; border: none; border-radius: 4px; }"
+        + "".join(
+            f"QPushButton#{nome} {{ background-color: {colore}; }}"
+            f"QPushButton#{nome}:hover {{ background-color: {hover}; }}"
+            for nome, (colore, hover) in _BTN_COLORI.items()
+        )
+        + "QLabel#desc { font-size: 12px; }"
+        "QLabel#opzione, QCheckBox#opzione { font-weight: normal; font-size: 10px; }"
+        "QLabel#sezione { font-size: 10px; font-weight: bold; }"
+        "QSpinBox#spin { font-size: 11px; padding: 2px; }"
+        "QComboBox#combo, QComboBox#combo QAbstractItemView { font-size: 10px; }"
     )
 
     def __init__(self, parent=None, default_buffer_m=50,
@@ -244,10 +279,7 @@ class SceltaModalitaDialog(QDialog):
             '(<a href="https://creativecommons.org/licenses/by/4.0/deed.it">'
             'CC-BY 4.0</a>)'
         )
-        font_titolo = QFont()
-        font_titolo.setPointSize(13)
-        font_titolo.setBold(True)
-        titolo_lbl.setFont(font_titolo)
+        titolo_lbl.setFont(_font_titolo(13))
         titolo_lbl.setAlignment(_AlignCenter)
         titolo_lbl.setTextFormat(_RichText)
         titolo_lbl.setOpenExternalLinks(True)
@@ -262,7 +294,7 @@ class SceltaModalitaDialog(QDialog):
         # Linea spessa sotto il titolo
         sep_title = QFrame()
         sep_title.setFrameShape(QFrame.Shape.HLine)
-        sep_title.setStyleSheet("border: none; border-top: 2px solid #aaa;")
+        sep_title.setObjectName("sepTitolo")
         layout.addWidget(sep_title)
 
         layout.addSpacing(2)
@@ -279,7 +311,7 @@ class SceltaModalitaDialog(QDialog):
         # --- Separatore ---
         sep = QFrame()
         sep.setFrameShape(QFrame.Shape.HLine)
-        sep.setStyleSheet("color: #ccc;")
+        sep.setObjectName("sep")
         layout.addWidget(sep)
 
         # --- Riga Output ---
@@ -295,43 +327,28 @@ class SceltaModalitaDialog(QDialog):
         # --- Separatore ---
         sep2 = QFrame()
         sep2.setFrameShape(QFrame.Shape.HLine)
-        sep2.setStyleSheet("color: #ccc;")
+        sep2.setObjectName("sep")
         layout.addWidget(sep2)
 
         # --- Pulsanti in basso ---
         bottom_layout = QHBoxLayout()
         btn_annulla = QPushButton("Chiudi")
         btn_annulla.setMinimumHeight(32)
-        btn_annulla.setStyleSheet(
-            "QPushButton { background-color: #D32F2F; color: white; "
-            "font-size: 11px; font-weight: bold; border: none; border-radius: 4px; }"
-            "QPushButton:hover { background-color: #B71C1C; }"
-        )
+        btn_annulla.setObjectName("btnChiudi")
         btn_annulla.clicked.connect(self.reject)
         bottom_layout.addWidget(btn_annulla, 3)
         btn_aiuto = QPushButton("❓ Guida")
         btn_aiuto.setMinimumHeight(32)
-        btn_aiuto.setStyleSheet(
-            "QPushButton { background-color: #4CAF50; color: white; "
-            "font-size: 11px; font-weight: bold; border: none; border-radius: 4px; }"
-            "QPushButton:hover { background-color: #45a049; }"
-        )
+        btn_aiuto.setObjectName("btnGuida")
         btn_aiuto.clicked.connect(self._on_aiuto)
         bottom_layout.addWidget(btn_aiuto, 1)
         layout.addLayout(bottom_layout)
 
         self.setLayout(layout)
+        self.setStyleSheet(self._QSS)
 
     # ---- Righe lista ----
 
-    _BTN_STYLE = (
-        "QPushButton {{ background-color: {color}; color: white; "
-        "font-size: 11px; font-weight: bold; border: none; border-radius: 4px; }}"
-        "QPushButton:hover {{ background-color: {hover}; }}"
-    )
-    _LBL_STYLE = "font-weight: normal; font-size: 10px;"
-    _DESC_STYLE = "font-size: 12px;"
-
     def _make_row(self):
         """Crea un QWidget riga con QHBoxLayout interno."""
         w = QWidget()
@@ -344,7 +361,7 @@ class SceltaModalitaDialog(QDialog):
         """Crea una linea separatrice orizzontale."""
         sep = QFrame()
         sep.setFrameShape(QFrame.Shape.HLine)
-        sep.setStyleSheet("color: #ddd;")
+        sep.setObjectName("sepRiga")
         return sep
 
     def _row_bbox(self):
@@ -352,11 +369,11 @@ class SceltaModalitaDialog(QDialog):
         btn = QPushButton("Disegna BBox")
         btn.setMinimumHeight(32)
         btn.setFixedWidth(160)
-        btn.setStyleSheet(self._BTN_STYLE.format(color="#2962FF", hover="#1E4FD0"))
+        btn.setObjectName("btnDisegna")
         btn.clicked.connect(self._on_disegna)
         row.addWidget(btn)
         desc = QLabel("Disegna un rettangolo sulla mappa")
-        desc.setStyleSheet(self._DESC_STYLE)
+        desc.setObjectName("desc")
         desc.setWordWrap(True)
         row.addWidget(desc, 1)
         return w
@@ -366,11 +383,11 @@ class SceltaModalitaDialog(QDialog):
         btn = QPushButton("Seleziona Poligono")
         btn.setMinimumHeight(32)
         btn.setFixedWidth(160)
-        btn.setStyleSheet(self._BTN_STYLE.format(color="#00897B", hover="#006B5E"))
+        btn.setObjectName("btnPoligono")
         btn.clicked.connect(self._on_poligono)
         row.addWidget(btn)
         desc = QLabel("Clicca su un poligono in mappa")
-        desc.setStyleSheet(self._DESC_STYLE)
+        desc.setObjectName("desc")
         desc.setWordWrap(True)
         row.addWidget(desc, 1)
         return w
@@ -380,22 +397,22 @@ class SceltaModalitaDialog(QDialog):
         btn = QPushButton("Seleziona Linea")
         btn.setMinimumHeight(32)
         btn.setFixedWidth(160)
-        btn.setStyleSheet(self._BTN_STYLE.format(color="#F57F17", hover="#E65100"))
+        btn.setObjectName("btnLinea")
         btn.clicked.connect(self._on_asse)
         row.addWidget(btn)
         buf_lbl = QLabel("Buffer:")
-        buf_lbl.setStyleSheet(self._LBL_STYLE)
+        buf_lbl.setObjectName("opzione")
         row.addWidget(buf_lbl)
         self.buffer_spinbox = QSpinBox()
         self.buffer_spinbox.setRange(0, 100)
         self.buffer_spinbox.setValue(self._default_buffer_m)
         self.buffer_spinbox.setSuffix(" m")
         self.buffer_spinbox.setFixedWidth(68)
-        self.buffer_spinbox.setStyleSheet("QSpinBox { font-size: 11px; padding: 2px; }")
+        self.buffer_spinbox.setObjectName("spin")
         self.buffer_spinbox.valueChanged.connect(self._on_buffer_changed)
         row.addWidget(self.buffer_spinbox)
         desc = QLabel("Clicca su una linea o disegna una polilinea")
-        desc.setStyleSheet(self._DESC_STYLE)
+        desc.setObjectName("desc")
         desc.setWordWrap(True)
         row.addWidget(desc, 1)
         return w
@@ -413,33 +430,33 @@ class SceltaModalitaDialog(QDialog):
         btn = QPushButton("Seleziona Punti")
         btn.setMinimumHeight(32)
         btn.setFixedWidth(160)
-        btn.setStyleSheet(self._BTN_STYLE.format(color="#7B1FA2", hover="#6A1B9A"))
+        btn.setObjectName("btnPunti")
         btn.clicked.connect(self._on_punti)
         main_row.addWidget(btn)
         buf_lbl = QLabel("Buffer:")
-        buf_lbl.setStyleSheet(self._LBL_STYLE)
+        buf_lbl.setObjectName("opzione")
         main_row.addWidget(buf_lbl)
         self.buffer_punti_spinbox = QSpinBox()
         self.buffer_punti_spinbox.setRange(0, 100)
         self.buffer_punti_spinbox.setValue(self._default_buffer_punti_m)
         self.buffer_punti_spinbox.setSuffix(" m")
         self.buffer_punti_spinbox.setFixedWidth(68)
-        self.buffer_punti_spinbox.setStyleSheet("QSpinBox { font-size: 11px; padding: 2px; }")
+        self.buffer_punti_spinbox.setObjectName("spin")
         self.buffer_punti_spinbox.valueChanged.connect(self._on_buffer_punti_changed)
         main_row.addWidget(self.buffer_punti_spinbox)
         snap_lbl = QLabel("Snap:")
-        snap_lbl.setStyleSheet(self._LBL_STYLE)
+        snap_lbl.setObjectName("opzione")
         main_row.addWidget(snap_lbl)
         self.snap_spinbox = QSpinBox()
         self.snap_spinbox.setRange(1, 50)
         self.snap_spinbox.setValue(self._default_snap_px)
         self.snap_spinbox.setSuffix(" px")
         self.snap_spinbox.setFixedWidth(68)
-        self.snap_spinbox.setStyleSheet("QSpinBox { font-size: 11px; padding: 2px; }")
+        self.snap_spinbox.setObjectName("spin")
         self.snap_spinbox.valueChanged.connect(self._on_snap_changed)
         main_row.addWidget(self.snap_spinbox)
         desc = QLabel("Clicca su layer di punti per scaricare")
-        desc.setStyleSheet(self._DESC_STYLE)
+        desc.setObjectName("desc")
         desc.setWordWrap(True)
         main_row.addWidget(desc, 1)
         vbox.addLayout(main_row)
@@ -449,11 +466,11 @@ class SceltaModalitaDialog(QDialog):
         sub_row.setSpacing(8)
         src_lbl = QLabel("Sorgente:")
         src_lbl.setFixedWidth(68)
-        src_lbl.setStyleSheet(self._LBL_STYLE)
+        src_lbl.setObjectName("opzione")
         sub_row.addWidget(src_lbl)
         self.combo_source_layer = QComboBox()
         self.combo_source_layer.addItem("(clicca sulla mappa)", None)
-        self.combo_source_layer.setStyleSheet("font-size: 10px;")
+        self.combo_source_layer.setObjectName("combo")
         self.combo_source_layer.setToolTip(
             "Scegli un layer punti dal progetto oppure lascia\n"
             "'(clicca sulla mappa)' per selezionarlo cliccando."
@@ -466,11 +483,11 @@ class SceltaModalitaDialog(QDialog):
     def _row_output(self):
         w, row = self._make_row()
         self.check_output_globale = QCheckBox("Aggiungi a layer esistente:")
-        self.check_output_globale.setStyleSheet(self._LBL_STYLE)
+        self.check_output_globale.setObjectName("opzione")
         self.check_output_globale.setChecked(False)
         row.addWidget(self.check_output_globale)
         self.combo_output_globale = QComboBox()
-        self.combo_output_globale.setStyleSheet("font-size: 10px;")
+        self.combo_output_globale.setObjectName("combo")
         self.combo_output_globale.setEnabled(False)
         self.combo_output_globale.setToolTip(
             "Layer Particelle WFS esistente a cui accodare i risultati\n"
@@ -479,7 +496,7 @@ class SceltaModalitaDialog(QDialog):
         row.addWidget(self.combo_output_globale, 1)
         lbl = QLabel("OUTPUT")
         lbl.setFixedWidth(55)
-        lbl.setStyleSheet("font-size: 10px; font-weight: bold;")
+        lbl.setObjectName("sezione")
         row.addWidget(lbl)
         return w
 
@@ -488,16 +505,16 @@ class SceltaModalitaDialog(QDialog):
         self.check_espandi_catastale = QCheckBox(
             "Espandi riferimento catastale (sezione, foglio, allegato, sviluppo)"
         )
-        self.check_espandi_catastale.setStyleSheet(self._LBL_STYLE)
+        self.check_espandi_catastale.setObjectName("opzione")
         self.check_espandi_catastale.setChecked(False)
         row.addWidget(self.check_espandi_catastale)
         self.check_carica_wms = QCheckBox("Carica WMS Cartografia Catastale")
-        self.check_carica_wms.setStyleSheet(self._LBL_STYLE)
+        self.check_carica_wms.setObjectName("opzione")
         self.check_carica_wms.setChecked(False)
         row.addWidget(self.check_carica_wms)
         lbl = QLabel("OPZIONI")
         lbl.setFixedWidth(55)
-        lbl.setStyleSheet("font-size: 10px; font-weight: bold;")
+        lbl.setObjectName("sezione")
         row.addWidget(lbl)
         return w
 
@@ -526,31 +543,39 @@ class SceltaModalitaDialog(QDialog):
 
     # ---- Slot ----
 
+    @pyqtSlot()
     def _on_disegna(self):
         self.scelta = "disegna"
         self.accept()
 
+    @pyqtSlot()
     def _on_poligono(self):
         self.scelta = "poligono"
         self.accept()
 
+    @pyqtSlot(int)
     def _on_buffer_changed(self, value):
         self.buffer_distance = value
 
+    @pyqtSlot()
     def _on_asse(self):
         self.scelta = "asse"
         self.accept()
 
+    @pyqtSlot(int)
     def _on_buffer_punti_changed(self, value):
         self.buffer_punti_distance = value
 
+    @pyqtSlot(int)
     def _on_snap_changed(self, value):
         self.snap_tolerance = value
 
+    @pyqtSlot()
     def _on_punti(self):
         self.scelta = "punti"
         self.accept()
 
+    @pyqtSlot(bool)
     def _on_output_globale_toggled(self, checked):
         """Abilita/disabilita combo globale."""
         self.combo_output_globale.setEnabled(checked)
@@ -578,6 +603,7 @@ class SceltaModalitaDialog(QDialog):
             return None
         return QgsProject.instance().mapLayer(layer_id)
     
+    @pyqtSlot()
     def _on_aiuto(self):
         """Apre la pagina di aiuto del plugin su GitHub Pages."""
         help_url = "https://pigreco.github.io/wfs_catasto_download_particelle_bbox/"
@@ -10,14 +10,25 @@ Autore: Salvatore Fiandaca
 Email: pigrecoinfinito@gmail.com
 """
 
+import email.utils
+import hashlib
+import http.client
+import io
 import math
 import os
-import tempfile
+import re
+import shutil
+import threading
 import time
-import urllib.request
+import urllib.parse
+import uuid
 import webbrowser
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from xml.etree import ElementTree
 
+from osgeo import gdal
 from qgis.core import (
     Qgis,
     QgsProject,
@@ -31,13 +42,15 @@ from qgis.core import (
     QgsFeatureRequest,
     QgsGeometry,
     QgsFeature,
+    QgsFeatureSink,
+    QgsSpatialIndex,
     QgsField,
     QgsExpression,
     QgsRuleBasedRenderer,
     QgsFillSymbol,
 )
 from qgis.gui import QgsMapTool, QgsRubberBand
-from qgis.PyQt.QtCore import Qt, QMetaType, QTimer, QSettings
+from qgis.PyQt.QtCore import Qt, QMetaType, QObject, QTimer, QSettings, QEventLoop, pyqtSignal
 from qgis.PyQt.QtGui import QColor, QIcon, QKeySequence
 from qgis.PyQt.QtWidgets import (
     QAction,
@@ -71,15 +84,32 @@ def _wkb_display_string(wkb_type):
 
 
 def _is_polygon_layer(layer):
-    return layer.geometryType() == Qgis.GeometryType.Polygon
+    return layer.geometryType() == _GEOM_POLYGON
 
 
 def _is_line_layer(layer):
-    return layer.geometryType() == Qgis.GeometryType.Line
+    return layer.geometryType() == _GEOM_LINE
 
 
 def _is_point_layer(layer):
-    return layer.geometryType() == Qgis.GeometryType.Point
+    return layer.geometryType() == _GEOM_POINT
+
+
+def _layer_vettoriali(filtro_tipo):
+    """Layer vettoriali del progetto per cui `filtro_tipo(layer)` è vero, in un solo passaggio.
+
+    Il layer attivo (quasi sempre quello su cui l'utente clicca) viene messo
+    per primo, così la ricerca del click si ferma di solito al primo layer.
+    """
+    layers = [
+        lyr for lyr in QgsProject.instance().mapLayers().values()
+        if isinstance(lyr, QgsVectorLayer) and filtro_tipo(lyr)
+    ]
+    attivo = qgis_iface.activeLayer() if qgis_iface else None
+    if attivo in layers:
+        layers.remove(attivo)
+        layers.insert(0, attivo)
+    return layers
 
 
 def _set_show_feature_count(tree_layer, value):
@@ -105,6 +135,10 @@ def _refresh_feature_counts_deferred(layer_id):
         print(f"[WFS Catasto] deferred refreshLayerLegend: {e}")
 
 
+# Renderer modello costruito alla prima applicazione dello stile, poi clonato
+_RENDERER_PARTICELLE = None
+
+
 def _applica_stile_particelle(layer):
     """Applica stile rule-based al layer particelle in base al campo LABEL.
 
@@ -112,6 +146,14 @@ def _applica_stile_particelle(layer):
     - STRADA → grigio
     - ACQUA → blu
     """
+    global _RENDERER_PARTICELLE
+    if _RENDERER_PARTICELLE is None:
+        _RENDERER_PARTICELLE = _crea_renderer_particelle()
+    layer.setRenderer(_RENDERER_PARTICELLE.clone())
+
+
+def _crea_renderer_particelle():
+    """Costruisce il renderer rule-based delle particelle (usato come modello)."""
     # Simbolo base (serve come root per il renderer)
     root_rule = QgsRuleBasedRenderer.Rule(None)
 
@@ -148,14 +190,14 @@ def _applica_stile_particelle(layer):
     rule_particella.setIsElse(True)
     root_rule.appendChild(rule_particella)
 
-    renderer = QgsRuleBasedRenderer(root_rule)
-    layer.setRenderer(renderer)
+    return QgsRuleBasedRenderer(root_rule)
 
 
 _WindowModal = Qt.WindowModality.WindowModal
 _DashLine = Qt.PenStyle.DashLine
 _DialogAccepted = QDialog.DialogCode.Accepted
 _Key_Escape = Qt.Key.Key_Escape
+_WidgetWithChildrenShortcut = Qt.ShortcutContext.WidgetWithChildrenShortcut
 _LeftButton = Qt.MouseButton.LeftButton
 _RightButton = Qt.MouseButton.RightButton
 _MB_Yes = QMessageBox.StandardButton.Yes
@@ -166,6 +208,7 @@ _MB_No = QMessageBox.StandardButton.No
 # CONFIGURAZIONE
 # =============================================================================
 WFS_CRS_ID = "EPSG:6706"
+_WFS_CRS = QgsCoordinateReferenceSystem(WFS_CRS_ID)
 WFS_BASE_URL = (
     "https://wfs.cartografia.agenziaentrate.gov.it/inspire/wfs/owfs01.php?"
     "service=WFS&request=GetFeature&version=2.0.0"
@@ -173,10 +216,36 @@ WFS_BASE_URL = (
 )
 # Area massima per singola tile in km² (soglia sicurezza WFS)
 MAX_TILE_KM2 = 4.0
+# Proprietà geometrica delle particelle usata nel filtro spaziale lato server (FES 2.0)
+WFS_CAMPO_GEOMETRIA = "geometry"
+# Il filtro lato server si invia solo se la parte di buffer nel tile copre
+# meno di questa frazione dell'area del tile (altrimenti basta il bbox)
+SOGLIA_FILTRO_SERVER = 0.8
+# Oltre questo numero di punti il post-filtro usa un indice spaziale sui punti
+# invece di testare ogni particella contro l'intera MultiPoint
+SOGLIA_INDICE_PUNTI = 32
 # Pausa tra le chiamate WFS in secondi
 PAUSA_SECONDI = 5
+# Pausa massima quando il server risponde 429/503 (la pausa raddoppia a ogni rifiuto)
+PAUSA_MAX_SECONDI = 60
+# Tentativi per tile quando il server risponde 429/503 (sotto carico)
+TENTATIVI_TILE = 4
+# Download WFS contemporanei (l'avvio delle richieste resta distanziato di PAUSA_SECONDI).
+# Modificabile con l'impostazione "wfs_catasto/concorrenza" del profilo (1 = sequenziale)
+CONCORRENZA_WFS = 2
+CONCORRENZA_WFS_MAX = 4
+# Feature inserite nel layer di output per ogni chiamata addFeatures
+BLOCCO_INSERIMENTO = 10000
+# Timeout delle connessioni HTTP verso il server WFS in secondi
+TIMEOUT_HTTP_SECONDI = 60
+# Redirect HTTP seguiti al massimo per una singola richiesta
+MAX_REDIRECT_HTTP = 5
 # Distanza buffer in metri di default
 BUFFER_DISTANCE_M = 50
+# Intervallo minimo tra due click di selezione (evita doppie ricerche/download)
+DEBOUNCE_CLICK_SECONDI = 0.3
+# Messaggi [DEBUG] in console (impostazione "wfs_catasto/debug" del profilo QGIS)
+DEBUG = QSettings().value("wfs_catasto/debug", False, type=bool)
 
 # WMS Catasto
 WMS_BASE_URL = "https://wms.cartografia.agenziaentrate.gov.it/inspire/wms/ows01.php"
@@ -197,28 +266,164 @@ WMS_LAYER_NAME = "Cartografia Catastale WMS AdE"
 # FUNZIONI COMUNI
 # =============================================================================
 
-def pulisci_rubberband(canvas):
-    """Rimuove eventuali rubber band precedenti dal canvas."""
-    if hasattr(canvas, '_wfs_rubberband') and canvas._wfs_rubberband:
-        canvas.scene().removeItem(canvas._wfs_rubberband)
-        canvas._wfs_rubberband = None
-
-
-def disegna_rubberband_da_rect(canvas, rect, colore_fill, colore_bordo):
-    """Disegna un QgsRubberBand rettangolare sul canvas."""
-    pulisci_rubberband(canvas)
-    rb = QgsRubberBand(canvas, _GEOM_POLYGON)
-    rb.setColor(QColor(*colore_fill))
-    rb.setStrokeColor(QColor(*colore_bordo))
-    rb.setWidth(2)
-    rb.addPoint(QgsPointXY(rect.xMinimum(), rect.yMinimum()))
-    rb.addPoint(QgsPointXY(rect.xMaximum(), rect.yMinimum()))
-    rb.addPoint(QgsPointXY(rect.xMaximum(), rect.yMaximum()))
-    rb.addPoint(QgsPointXY(rect.xMinimum(), rect.yMaximum()))
-    rb.addPoint(QgsPointXY(rect.xMinimum(), rect.yMinimum()))
-    rb.show()
-    canvas._wfs_rubberband = rb
-    return rb
+# Indici spaziali dei layer senza indice nativo: layer id -> (featureCount, indice)
+_CACHE_INDICI_SPAZIALI = {}
+# Segnali di invalidazione collegati per layer: layer id -> [(segnale, slot), ...]
+_CONNESSIONI_INDICI_SPAZIALI = {}
+
+
+def _invalida_indice_spaziale(layer_id):
+    if layer_id in _CACHE_INDICI_SPAZIALI:
+        _CACHE_INDICI_SPAZIALI[layer_id] = None
+
+
+def _rimuovi_indice_spaziale(layer_id):
+    """Layer in eliminazione: scarta indice e connessioni (gli slot muoiono col layer)."""
+    _CACHE_INDICI_SPAZIALI.pop(layer_id, None)
+    _CONNESSIONI_INDICI_SPAZIALI.pop(layer_id, None)
+
+
+def _svuota_cache_indici_spaziali():
+    """Scollega i segnali dai layer e libera gli indici in cache (unload del plugin)."""
+    for connessioni in _CONNESSIONI_INDICI_SPAZIALI.values():
+        for segnale, slot in connessioni:
+            try:
+                segnale.disconnect(slot)
+            except (TypeError, RuntimeError):
+                pass
+    _CONNESSIONI_INDICI_SPAZIALI.clear()
+    _CACHE_INDICI_SPAZIALI.clear()
+
+
+def _indice_spaziale_layer(layer):
+    """
+    Restituisce un QgsSpatialIndex del layer, costruito alla prima richiesta e
+    riusato finché il layer non viene modificato (segnali di editing o
+    featureCount diverso, es. feature aggiunte direttamente dal provider).
+    """
+    layer_id = layer.id()
+    n_feature = layer.featureCount()
+    voce = _CACHE_INDICI_SPAZIALI.get(layer_id)
+    if voce is not None and voce[0] == n_feature:
+        return voce[1]
+
+    if layer_id not in _CACHE_INDICI_SPAZIALI:
+        # Primo utilizzo: collega i segnali di invalidazione una sola volta
+        # (memorizzati per poterli scollegare in unload)
+        connessioni = []
+        for segnale in (layer.geometryChanged, layer.featureAdded,
+                        layer.featureDeleted, layer.dataChanged):
+            slot = lambda *_args, lid=layer_id: _invalida_indice_spaziale(lid)
+            segnale.connect(slot)
+            connessioni.append((segnale, slot))
+        slot = lambda lid=layer_id: _rimuovi_indice_spaziale(lid)
+        layer.willBeDeleted.connect(slot)
+        connessioni.append((layer.willBeDeleted, slot))
+        _CONNESSIONI_INDICI_SPAZIALI[layer_id] = connessioni
+
+    # Le geometrie restano nell'indice: nearestNeighbor usa la distanza esatta
+    sindex = QgsSpatialIndex(
+        layer.getFeatures(QgsFeatureRequest().setNoAttributes()),
+        None,
+        QgsSpatialIndex.Flag.FlagStoreFeatureGeometries,
+    )
+    _CACHE_INDICI_SPAZIALI[layer_id] = (n_feature, sindex)
+    return sindex
+
+
+def _richiesta_feature_nel_rect(layer, search_rect):
+    """
+    QgsFeatureRequest per le feature del layer il cui bbox interseca il rettangolo
+    di ricerca (solo geometria: gli attributi non vengono letti). Niente
+    ExactIntersect: il test esatto lo fanno comunque gli strumenti sul candidato.
+    Se il provider dichiara di non avere un indice spaziale (memory, GeoJSON,
+    CSV...), i candidati vengono presi dall'indice in cache invece di scandire
+    il layer. Con presenza sconosciuta (WFS, ArcGIS REST, virtual...) il filtro
+    resta al provider: costruire l'indice scaricherebbe l'intero layer.
+    """
+    request = QgsFeatureRequest().setFilterRect(search_rect).setNoAttributes()
+    if layer.hasSpatialIndex() == Qgis.SpatialIndexPresence.NotPresent:
+        request.setFilterFids(_indice_spaziale_layer(layer).intersects(search_rect))
+    return request
+
+
+# Trasformazioni di coordinate riusate tra i click: (crs sorgente, crs destinazione) -> transform
+_CACHE_TRASFORMAZIONI = {}
+
+
+def _chiave_crs(crs):
+    return crs.authid() or crs.toWkt()
+
+
+def _stesso_crs(crs_a, crs_b):
+    """
+    Confronto rapido tra due CRS tramite lo SRID intero (nessuna stringa
+    creata da C++); per i CRS senza SRID (personalizzati) ripiega su authid.
+    """
+    srid_a = crs_a.postgisSrid()
+    srid_b = crs_b.postgisSrid()
+    if srid_a > 0 and srid_b > 0:
+        return srid_a == srid_b
+    return crs_a.authid() == crs_b.authid()
+
+
+# authid -> CRS geografico (True/False); la proprietà non cambia per un dato authid
+_CACHE_CRS_GEOGRAFICO = {}
+
+
+def _crs_geografico(crs):
+    """isGeographic() con cache per authid (i CRS personalizzati senza authid non sono in cache)."""
+    authid = crs.authid()
+    if not authid:
+        return crs.isGeographic()
+    geografico = _CACHE_CRS_GEOGRAFICO.get(authid)
+    if geografico is None:
+        geografico = _CACHE_CRS_GEOGRAFICO[authid] = crs.isGeographic()
+    return geografico
+
+
+def _get_xform(src_crs, dst_crs):
+    """
+    Restituisce un QgsCoordinateTransform in cache per la coppia di CRS.
+    La pipeline PROJ viene inizializzata solo alla prima richiesta; la cache
+    si svuota al cambio di CRS o di contesto di trasformazione del progetto.
+    """
+    chiave = (_chiave_crs(src_crs), _chiave_crs(dst_crs))
+    xform = _CACHE_TRASFORMAZIONI.get(chiave)
+    if xform is None:
+        xform = QgsCoordinateTransform(
+            src_crs, dst_crs, QgsProject.instance().transformContext()
+        )
+        _CACHE_TRASFORMAZIONI[chiave] = xform
+    return xform
+
+
+# CRS del progetto letto una volta e riusato tra i click (svuotato al crsChanged)
+_CACHE_CRS_PROGETTO = {}
+
+
+def _crs_progetto():
+    crs = _CACHE_CRS_PROGETTO.get("crs")
+    if crs is None:
+        crs = _CACHE_CRS_PROGETTO["crs"] = QgsProject.instance().crs()
+    return crs
+
+
+def _geometria_in_crs(geom, src_crs, dst_crs):
+    """
+    Restituisce `geom` nel CRS `dst_crs`: la geometria stessa se i CRS coincidono
+    (nessuna copia), altrimenti una copia trasformata con la trasformazione in cache.
+    """
+    if _stesso_crs(src_crs, dst_crs):
+        return geom
+    geom_dst = QgsGeometry(geom)
+    geom_dst.transform(_get_xform(src_crs, dst_crs))
+    return geom_dst
+
+
+def _svuota_cache_trasformazioni(*_args):
+    _CACHE_TRASFORMAZIONI.clear()
+    _CACHE_CRS_PROGETTO.clear()
 
 
 def trasforma_bbox_a_wfs(rect, source_crs):
@@ -226,9 +431,7 @@ def trasforma_bbox_a_wfs(rect, source_crs):
     Trasforma un QgsRectangle dal CRS sorgente a EPSG:6706.
     Restituisce (min_lat, min_lon, max_lat, max_lon).
     """
-    wfs_crs = QgsCoordinateReferenceSystem(WFS_CRS_ID)
-
-    if source_crs.authid() == wfs_crs.authid():
+    if _stesso_crs(source_crs, _WFS_CRS):
         print(f"[CRS] Il CRS sorgente è già {WFS_CRS_ID}, nessuna riproiezione necessaria.")
         min_lon = rect.xMinimum()
         max_lon = rect.xMaximum()
@@ -236,8 +439,7 @@ def trasforma_bbox_a_wfs(rect, source_crs):
         max_lat = rect.yMaximum()
     else:
         print(f"[CRS] Riproiezione da {source_crs.authid()} a {WFS_CRS_ID}...")
-        transform = QgsCoordinateTransform(source_crs, wfs_crs, QgsProject.instance())
-        rect_wfs = transform.transformBoundingBox(rect)
+        rect_wfs = _get_xform(source_crs, _WFS_CRS).transformBoundingBox(rect)
         min_lon = rect_wfs.xMinimum()
         max_lon = rect_wfs.xMaximum()
         min_lat = rect_wfs.yMinimum()
@@ -271,6 +473,30 @@ def _determina_utm_epsg(lon, lat):
     return f"EPSG:{epsg}"
 
 
+def _precarica_trasformazioni():
+    """
+    Prepara in cache le trasformazioni più probabili (progetto -> WFS e, per i
+    layer di punti, layer -> WFS e layer -> UTM -> WFS) mentre il dialog è
+    aperto, così il primo click non paga l'inizializzazione delle pipeline PROJ.
+    Gira nel thread principale: cache e QgsProject non sono thread-safe.
+    """
+    project_crs = _crs_progetto()
+    if project_crs.isValid():
+        _get_xform(project_crs, _WFS_CRS)
+    for layer in _layer_vettoriali(_is_point_layer):
+        layer_crs = layer.crs()
+        if not layer_crs.isValid():
+            continue
+        _get_xform(layer_crs, _WFS_CRS)
+        if layer_crs.isGeographic() and not layer.extent().isEmpty():
+            centro = layer.extent().center()
+            utm_crs = QgsCoordinateReferenceSystem(
+                _determina_utm_epsg(centro.x(), centro.y())
+            )
+            _get_xform(layer_crs, utm_crs)
+            _get_xform(utm_crs, _WFS_CRS)
+
+
 def carica_wms_catasto():
     """
     Aggiunge la connessione WMS del Catasto al profilo QGIS (se non presente)
@@ -318,21 +544,39 @@ def carica_wms_catasto():
     # Inserisci in fondo ma prima di eventuali mappe di sfondo (XYZ tiles)
     children = root.children()
     pos = len(children)  # default: ultima posizione
+    # (providerType() prima di source(): l'URI si costruisce solo per i layer wms)
     for i in range(len(children) - 1, -1, -1):
-        node = children[i]
-        if hasattr(node, "layer") and node.layer():
-            src = node.layer().source()
-            if "type=xyz" in src:
-                pos = i
-            else:
-                break
-        else:
+        layer = children[i].layer() if hasattr(children[i], "layer") else None
+        if layer is None or layer.providerType() != "wms" or "type=xyz" not in layer.source():
             break
+        pos = i
     root.insertLayer(pos, wms_layer)
 
     print(f"[WMS] Layer '{WMS_LAYER_NAME}' caricato nel progetto")
 
 
+# CCCC Z FFFF A S: comune, sezione, foglio, allegato, sviluppo (prima del punto)
+_NCR_RE = re.compile(r"[^.]{4}([^.])([^.]{4})([^.])([^.])(?:\.|$)")
+
+
+def _espandi_ncr(ncr):
+    """
+    Scompone NATIONALCADASTRALREFERENCE (formato CCCCZFFFFAS.particella) in
+    (sezione, foglio, allegato, sviluppo) con un'unica regex precompilata.
+    Restituisce None se il codice non ha il formato atteso.
+    """
+    m = _NCR_RE.match(ncr or "")
+    if m is None:
+        return None
+    sez, foglio, allegato, sviluppo = m.groups()
+    return (
+        "" if sez == "_" else sez,
+        int(foglio) if foglio.isdigit() else None,
+        allegato,
+        sviluppo,
+    )
+
+
 def calcola_griglia_tile(min_lat, min_lon, max_lat, max_lon, max_tile_km2):
     """
     Suddivide il bbox in una griglia di tile, ciascuna con area <= max_tile_km2.
@@ -352,14 +596,16 @@ def calcola_griglia_tile(min_lat, min_lon, max_lat, max_lon, max_tile_km2):
     delta_lat = (max_lat - min_lat) / n_rows
     delta_lon = (max_lon - min_lon) / n_cols
 
-    tiles = []
-    for r in range(n_rows):
-        for c in range(n_cols):
-            t_min_lat = min_lat + r * delta_lat
-            t_max_lat = min_lat + (r + 1) * delta_lat
-            t_min_lon = min_lon + c * delta_lon
-            t_max_lon = min_lon + (c + 1) * delta_lon
-            tiles.append((t_min_lat, t_min_lon, t_max_lat, t_max_lon))
+    # Bordi della griglia calcolati una volta sola (n+1 valori per asse)
+    # (come linspace: l'ultimo bordo è esattamente il massimo, senza errori
+    # di arrotondamento che lascerebbero una striscia scoperta)
+    bordi_lat = [min_lat + r * delta_lat for r in range(n_rows)] + [max_lat]
+    bordi_lon = [min_lon + c * delta_lon for c in range(n_cols)] + [max_lon]
+    tiles = [
+        (bordi_lat[r], bordi_lon[c], bordi_lat[r + 1], bordi_lon[c + 1])
+        for r in range(n_rows)
+        for c in range(n_cols)
+    ]
 
     print(f"\n[TILING] Area totale: ~{area_totale:.1f} km²")
     print(f"[TILING] Griglia: {n_rows} righe x {n_cols} colonne = {len(tiles)} tile")
@@ -368,61 +614,525 @@ def calcola_griglia_tile(min_lat, min_lon, max_lat, max_lon, max_tile_km2):
     return tiles
 
 
-def scarica_singolo_tile(min_lat, min_lon, max_lat, max_lon):
+# Connessione HTTPS persistente per thread: evita un handshake TCP+TLS per tile
+_HTTP_LOCALE = threading.local()
+
+
+def _connessione_wfs(host):
+    """Restituisce la connessione keep-alive del thread corrente verso `host`."""
+    conn = getattr(_HTTP_LOCALE, "conn", None)
+    if conn is None or _HTTP_LOCALE.host != host:
+        if conn is not None:
+            conn.close()
+        conn = http.client.HTTPSConnection(host, timeout=TIMEOUT_HTTP_SECONDI)
+        _HTTP_LOCALE.conn = conn
+        _HTTP_LOCALE.host = host
+        _HTTP_LOCALE.usata = False
+    return conn
+
+
+def _chiudi_connessione_wfs():
+    conn = getattr(_HTTP_LOCALE, "conn", None)
+    if conn is not None:
+        conn.close()
+    _HTTP_LOCALE.conn = None
+
+
+class _ErroreHttp(OSError):
     """
-    Scarica un singolo tile WFS.
-    Restituisce (lista_feature, info_dict) oppure (None, None) in caso di errore.
+    Risposta HTTP diversa da 200; lo stato resta disponibile in `status` e
+    l'attesa chiesta dal server (Retry-After, in secondi) in `retry_after`.
     """
-    bbox_str = f"{min_lat},{min_lon},{max_lat},{max_lon},urn:ogc:def:crs:EPSG::6706"
-    wfs_url = f"{WFS_BASE_URL}&bbox={bbox_str}"
 
+    def __init__(self, status, reason, retry_after=None):
+        super().__init__(f"HTTP {status} {reason}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _secondi_retry_after(valore):
+    """
+    Secondi di attesa indicati dall'intestazione Retry-After (numero di secondi
+    o data HTTP), oppure None se assente o non interpretabile.
+    """
+    if not valore:
+        return None
+    valore = valore.strip()
+    if valore.isdigit():
+        return float(valore)
     try:
-        tmp_file = tempfile.NamedTemporaryFile(
-            suffix=".gml", prefix="wfs_tile_", delete=False
-        )
-        tmp_path = tmp_file.name
-        tmp_file.close()
-
-        if not wfs_url.startswith("https://"):
-            raise ValueError(f"Schema URL non permesso: {wfs_url}")
-        with urllib.request.urlopen(wfs_url) as resp:  # nosec B310
-            with open(tmp_path, "wb") as f:
-                f.write(resp.read())
-
-        # Verifica errori nel contenuto
-        with open(tmp_path, 'r', encoding='utf-8', errors='replace') as f:
-            contenuto = f.read(2048)
-        if '<ExceptionReport' in contenuto or '<ows:ExceptionReport' in contenuto:
-            print("  [ERRORE] Il server ha restituito un errore per questo tile")
-            os.remove(tmp_path)
-            return None, None
+        data = email.utils.parsedate_to_datetime(valore)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, data.timestamp() - time.time())
+
+
+def _copia_risposta(resp, fout):
+    """
+    Copia il corpo della risposta in `fout` a blocchi da 64 KB, decomprimendo
+    al volo se il server ha risposto con Content-Encoding: gzip (il GML si
+    comprime di 5-10 volte). La risposta viene sempre letta fino in fondo,
+    così la connessione keep-alive resta riutilizzabile.
+    """
+    if (resp.getheader("Content-Encoding") or "").lower() != "gzip":
+        shutil.copyfileobj(resp, fout, 1 << 16)
+        return
+    decompressore = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    while True:
+        blocco = resp.read(1 << 16)
+        if not blocco:
+            break
+        fout.write(decompressore.decompress(blocco))
+    fout.write(decompressore.flush())
+
+
+def _scarica_url(url, fout, redirect_rimasti=MAX_REDIRECT_HTTP):
+    """
+    Scarica `url` (solo https) scrivendo il corpo nel file-like `fout`,
+    riusando la connessione del thread.
+    Se il server ha chiuso la connessione keep-alive, riprova una volta con una nuova.
+    I redirect seguono `Location` con questa stessa funzione (keep-alive, gzip
+    ed _ErroreHttp anche sulla destinazione), al massimo `redirect_rimasti`.
+    """
+    parti = urllib.parse.urlsplit(url)
+    if parti.scheme != "https":
+        raise ValueError(f"Schema URL non permesso: {url}")
+    target = f"{parti.path}?{parti.query}" if parti.query else parti.path
+
+    for tentativo in range(2):
+        conn = _connessione_wfs(parti.netloc)
+        riusata = _HTTP_LOCALE.usata
+        try:
+            conn.request("GET", target, headers={"Accept-Encoding": "gzip"})
+            resp = conn.getresponse()
+        except (ConnectionResetError, BrokenPipeError, http.client.BadStatusLine):
+            _chiudi_connessione_wfs()
+            if riusata and tentativo == 0:
+                continue
+            raise
+        except Exception:
+            _chiudi_connessione_wfs()
+            raise
+        _HTTP_LOCALE.usata = True
+
+        try:
+            redirect = resp.status in (301, 302, 303, 307, 308)
+            if redirect:
+                resp.read()
+                location = resp.getheader("Location")
+                if not location or redirect_rimasti <= 0:
+                    raise _ErroreHttp(resp.status, resp.reason)
+            elif resp.status != 200:
+                resp.read()
+                raise _ErroreHttp(
+                    resp.status, resp.reason,
+                    _secondi_retry_after(resp.getheader("Retry-After")),
+                )
+            else:
+                _copia_risposta(resp, fout)
+        except Exception:
+            _chiudi_connessione_wfs()
+            raise
+        if resp.will_close:
+            _chiudi_connessione_wfs()
+        if redirect:
+            _scarica_url(urllib.parse.urljoin(url, location), fout, redirect_rimasti - 1)
+        return
+
+
+# Esito di _scarica_tile per un tile senza feature (nessun GML da caricare)
+TILE_VUOTO = b""
+
+# Impostato quando il server rifiuta il filtro FES: i tile successivi del
+# download tornano alla sola richiesta per bbox
+_FILTRO_SERVER_RIFIUTATO = threading.Event()
 
-        # Carica con OGR
-        tmp_layer = QgsVectorLayer(tmp_path, "tile_tmp", "ogr")
+
+def _filtro_fes_intersects(anello):
+    """
+    Filtro FES 2.0 <Intersects> con il poligono `anello` [(lon, lat), ...]
+    (anello chiuso, EPSG:6706), da passare nel parametro FILTER di GetFeature.
+    Le coordinate GML seguono l'ordine assi dell'URN EPSG:6706 (lat lon).
+    """
+    pos_list = " ".join(f"{lat:.7f} {lon:.7f}" for lon, lat in anello)
+    return (
+        '<fes:Filter xmlns:fes="http://www.opengis.net/fes/2.0" '
+        'xmlns:gml="http://www.opengis.net/gml/3.2">'
+        f"<fes:Intersects><fes:ValueReference>{WFS_CAMPO_GEOMETRIA}</fes:ValueReference>"
+        '<gml:Polygon gml:id="filtro" srsName="urn:ogc:def:crs:EPSG::6706">'
+        f"<gml:exterior><gml:LinearRing><gml:posList>{pos_list}</gml:posList>"
+        "</gml:LinearRing></gml:exterior></gml:Polygon>"
+        "</fes:Intersects></fes:Filter>"
+    )
+
+
+def _leggi_radice_gml(dati):
+    """
+    Restituisce (nome locale, attributi) dell'elemento radice del GML (bytes),
+    analizzando il documento in streaming solo fino al primo tag.
+    ('', {}) se il contenuto non è XML valido: la lettura viene lasciata a OGR.
+    """
+    try:
+        for _evento, elem in ElementTree.iterparse(io.BytesIO(dati), events=("start",)):
+            return elem.tag.rsplit("}", 1)[-1], dict(elem.attrib)
+    except ElementTree.ParseError:
+        pass
+    return "", {}
+
+
+def _scarica_tile(min_lat, min_lon, max_lat, max_lon, limitatore=None, filtro=None):
+    """
+    Scarica in memoria la risposta GML di un tile WFS (solo rete).
+    Non usa oggetti QGIS: può essere eseguita in un thread di lavoro.
+    Se è indicato un _LimitatoreRichieste, gli segnala l'esito (429/503 o successo)
+    e, dopo un 429/503, riprova lo stesso tile fino a TENTATIVI_TILE volte.
+    Con `filtro` (XML FES) la richiesta usa FILTER al posto di BBOX; se il server
+    lo rifiuta, il tile viene richiesto di nuovo per bbox. Anche un tile filtrato
+    vuoto viene ricontrollato per bbox: proprietà geometrica e ordine assi del
+    filtro non sono verificati sul server, che potrebbe accettarlo senza applicarlo.
+    Restituisce i byte del GML, TILE_VUOTO se il server non ha
+    restituito feature, oppure None in caso di errore.
+    """
+    if filtro is not None and not _FILTRO_SERVER_RIFIUTATO.is_set():
+        wfs_url = f"{WFS_BASE_URL}&filter={urllib.parse.quote(filtro, safe='')}"
+    else:
+        filtro = None
+        bbox_str = f"{min_lat},{min_lon},{max_lat},{max_lon},urn:ogc:def:crs:EPSG::6706"
+        wfs_url = f"{WFS_BASE_URL}&bbox={bbox_str}"
+
+    filtro_vuoto = False
+    for tentativo in range(1, TENTATIVI_TILE + 1):
+        try:
+            buffer = io.BytesIO()
+            _scarica_url(wfs_url, buffer)
+            dati = buffer.getvalue()
+            if limitatore is not None:
+                limitatore.registra_successo()
+
+            # Verifica errori / tile vuoto leggendo solo l'elemento radice
+            radice, attributi = _leggi_radice_gml(dati)
+            if radice == "ExceptionReport":
+                if filtro is None:
+                    print("  [ERRORE] Il server ha restituito un errore per questo tile")
+                    return None
+                break
+            elif radice == "FeatureCollection" and attributi.get("numberReturned") == "0":
+                if filtro is None:
+                    return TILE_VUOTO
+                filtro_vuoto = True
+                break
+            else:
+                return dati
+
+        except Exception as e:
+            stato = getattr(e, "status", None)
+            if filtro is not None and stato == 400:
+                break
+            if limitatore is not None and stato in (429, 503):
+                # Server sotto carico: pausa più lunga e nuovo tentativo dello stesso tile
+                limitatore.rallenta(getattr(e, "retry_after", None))
+                if tentativo < TENTATIVI_TILE:
+                    print(f"  [WFS] Tile rifiutato (HTTP {stato}): "
+                          f"nuovo tentativo {tentativo + 1}/{TENTATIVI_TILE}")
+                    if not limitatore.attendi_turno():
+                        return None
+                    continue
+            print(f"  [ERRORE] Download tile fallito: {e}")
+            return None
+
+    # Uscita dal ciclo solo con il filtro FES: rifiutato dal server (da qui in
+    # poi solo bbox) oppure tile filtrato vuoto (ricontrollato per bbox)
+    if not filtro_vuoto and not _FILTRO_SERVER_RIFIUTATO.is_set():
+        _FILTRO_SERVER_RIFIUTATO.set()
+        print("  [WFS] Filtro spaziale non accettato dal server: uso la richiesta per bbox")
+    if limitatore is not None and not limitatore.attendi_turno():
+        return None
+    return _scarica_tile(min_lat, min_lon, max_lat, max_lon, limitatore)
+
+
+def _leggi_feature(layer):
+    """
+    Legge tutte le feature del layer in una lista preallocata su featureCount()
+    (noto per i GML del WFS), evitando i ridimensionamenti di list(getFeatures()).
+    """
+    n = layer.featureCount()
+    if n < 0:
+        return list(layer.getFeatures())
+
+    features = [None] * n
+    letti = 0
+    it = layer.getFeatures()
+    feat = QgsFeature()
+    while it.nextFeature(feat):
+        if letti < n:
+            features[letti] = feat
+        else:
+            features.append(feat)
+        letti += 1
+        feat = QgsFeature()
+    del features[letti:]
+    return features
+
+
+def _indice_campo_id(fields):
+    """
+    (nome, indice) del campo usato per la deduplicazione per attributo: il primo
+    presente tra gml_id, inspireid e nationalCadastralReference, oppure (None, -1).
+    """
+    for campo in ("gml_id", "inspireid", "nationalCadastralReference"):
+        idx = fields.indexOf(campo)
+        if idx >= 0:
+            return campo, idx
+    return None, -1
+
+
+def _carica_tile_da_gml(dati):
+    """
+    Carica con OGR il GML (bytes) scaricato da _scarica_tile, passando da un
+    file virtuale /vsimem di GDAL: nessuna scrittura su disco.
+    Da chiamare nel thread principale.
+    Restituisce (lista_feature, info_dict) oppure (None, None) in caso di errore.
+    """
+    mem_path = f"/vsimem/wfs_tile_{uuid.uuid4().hex}.gml"
+    try:
+        gdal.FileFromMemBuffer(mem_path, dati)
+        tmp_layer = QgsVectorLayer(mem_path, "tile_tmp", "ogr")
         if not tmp_layer.isValid():
-            os.remove(tmp_path)
             return None, None
 
-        features = list(tmp_layer.getFeatures())
+        features = _leggi_feature(tmp_layer)
         fields = tmp_layer.fields()
         wkb_type = tmp_layer.wkbType()
         crs = tmp_layer.crs()
-
-        # Pulizia
         del tmp_layer
-        try:
-            os.remove(tmp_path)
-            xsd_path = tmp_path.replace('.gml', '.xsd')
-            if os.path.exists(xsd_path):
-                os.remove(xsd_path)
-        except Exception:
-            pass
 
         return features, {"fields": fields, "wkb_type": wkb_type, "crs": crs}
 
     except Exception as e:
-        print(f"  [ERRORE] Download tile fallito: {e}")
+        print(f"  [ERRORE] Lettura tile fallita: {e}")
         return None, None
+    finally:
+        # Il GML e gli eventuali .gfs/.xsd generati da OGR accanto al file virtuale
+        for estensione in (".gml", ".gfs", ".xsd"):
+            percorso = mem_path[:-4] + estensione
+            if gdal.VSIStatL(percorso) is not None:
+                gdal.Unlink(percorso)
+
+
+def scarica_singolo_tile(min_lat, min_lon, max_lat, max_lon):
+    """
+    Scarica un singolo tile WFS.
+    Restituisce (lista_feature, info_dict) oppure (None, None) in caso di errore.
+    """
+    dati = _scarica_tile(min_lat, min_lon, max_lat, max_lon)
+    if dati is None:
+        return None, None
+    if dati == TILE_VUOTO:
+        return [], None
+    return _carica_tile_da_gml(dati)
+
+
+def _concorrenza_wfs():
+    """Numero di download WFS contemporanei: impostazione del profilo, tra 1 e CONCORRENZA_WFS_MAX."""
+    valore = QSettings().value("wfs_catasto/concorrenza", CONCORRENZA_WFS, type=int)
+    return max(1, min(valore, CONCORRENZA_WFS_MAX))
+
+
+class _LimitatoreRichieste:
+    """
+    Distanzia l'avvio delle richieste WFS di almeno `intervallo` secondi,
+    anche quando i download procedono in parallelo (thread-safe).
+    L'intervallo si adatta al server: raddoppia quando risponde 429/503
+    (fino a PAUSA_MAX_SECONDI) e torna verso il valore base dopo alcune
+    risposte corrette consecutive.
+    """
+
+    SUCCESSI_PER_ACCELERARE = 3
+
+    def __init__(self, intervallo):
+        self._intervallo_base = intervallo
+        self._intervallo = intervallo
+        self._successi = 0
+        self._lock = threading.Lock()
+        self._prossimo_avvio = 0.0
+        self._annullato = threading.Event()
+
+    def attendi_turno(self):
+        """Blocca fino al prossimo slot libero. Restituisce False se annullato."""
+        with self._lock:
+            avvio = max(time.monotonic(), self._prossimo_avvio)
+            self._prossimo_avvio = avvio + self._intervallo
+        attesa = max(0.0, avvio - time.monotonic())
+        return not self._annullato.wait(attesa)
+
+    def rallenta(self, retry_after=None):
+        """
+        Il server è sotto carico: raddoppia l'intervallo e sposta il prossimo avvio.
+        Se il server ha indicato un Retry-After, il prossimo avvio lo rispetta
+        (limitato a PAUSA_MAX_SECONDI).
+        """
+        with self._lock:
+            self._intervallo = min(self._intervallo * 2, PAUSA_MAX_SECONDI)
+            self._successi = 0
+            attesa = self._intervallo
+            if retry_after is not None:
+                attesa = max(attesa, min(retry_after, PAUSA_MAX_SECONDI))
+            self._prossimo_avvio = max(self._prossimo_avvio, time.monotonic() + attesa)
+            intervallo = self._intervallo
+        print(f"  [WFS] Server sotto carico: pausa tra le richieste portata a {intervallo:.0f} sec")
+
+    def registra_successo(self):
+        with self._lock:
+            if self._intervallo <= self._intervallo_base:
+                return
+            self._successi += 1
+            if self._successi >= self.SUCCESSI_PER_ACCELERARE:
+                self._intervallo = max(self._intervallo / 2, self._intervallo_base)
+                self._successi = 0
+
+    def annulla(self):
+        self._annullato.set()
+
+
+def _scarica_tile_limitato(limitatore, tile, filtro=None):
+    """
+    Job del pool: attende il turno e scarica il tile (solo byte, nessun oggetto
+    Qt/OGR nel thread). Restituisce i byte del GML, TILE_VUOTO, oppure None se
+    annullato o in errore.
+    """
+    if not limitatore.attendi_turno():
+        return None
+    return _scarica_tile(*tile, limitatore=limitatore, filtro=filtro)
+
+
+def _filtro_server_tile(filter_geom, tile):
+    """
+    Filtro FES per il tile: inviluppo convesso della parte di `filter_geom`
+    che cade nel tile (contiene sempre il buffer, con pochi vertici per l'URL).
+    None se il buffer copre quasi tutto il tile e basta la richiesta per bbox.
+    """
+    t_min_lat, t_min_lon, t_max_lat, t_max_lon = tile
+    tile_geom = QgsGeometry.fromRect(QgsRectangle(t_min_lon, t_min_lat, t_max_lon, t_max_lat))
+    inviluppo = tile_geom.intersection(filter_geom).convexHull()
+    if inviluppo.isEmpty() or inviluppo.area() >= tile_geom.area() * SOGLIA_FILTRO_SERVER:
+        return None
+    poligono = inviluppo.asPolygon()
+    if not poligono:
+        return None
+    return _filtro_fes_intersects([(p.x(), p.y()) for p in poligono[0]])
+
+
+def _prepara_geometria(geom):
+    """
+    Restituisce un QgsGeometryEngine GEOS preparato su `geom`, da usare per
+    molti test intersects() contro la stessa geometria (es. buffer filtro).
+    """
+    engine = QgsGeometry.createGeometryEngine(geom.constGet())
+    engine.prepareGeometry()
+    return engine
+
+
+def _interseca_punti(geom, engine_punti, indice_punti, parti_punti):
+    """
+    True se `geom` interseca almeno uno dei punti del post-filtro.
+    Con l'indice spaziale si testano solo i punti nel bbox della geometria,
+    altrimenti un solo test contro la MultiPoint preparata.
+    """
+    if indice_punti is None:
+        return engine_punti.intersects(geom.constGet())
+    return any(
+        geom.intersects(parti_punti[i])
+        for i in indice_punti.intersects(geom.boundingBox())
+    )
+
+
+def _chiave_geometria(geom):
+    """
+    Chiave compatta (16 byte) per riconoscere geometrie identiche: hash BLAKE2b
+    del WKB con coordinate agganciate a una griglia di 1e-6 gradi (~0.1 m).
+    """
+    wkb = geom.snappedToGrid(1e-6, 1e-6).asWkb()
+    return hashlib.blake2b(bytes(wkb), digest_size=16).digest()
+
+
+def _indici_campi(fields):
+    """Restituisce il dizionario nome campo -> indice per un QgsFields."""
+    return {fields.at(i).name(): i for i in range(fields.count())}
+
+
+def _crea_layer_memoria(layer_info, layer_name, campi_extra):
+    """
+    Crea il layer temporaneo in memoria con geometria, CRS e campi del WFS
+    (layer_info) più i campi aggiuntivi `campi_extra` (lista di QgsField).
+    """
+    geom_type_str = _wkb_display_string(layer_info["wkb_type"])
+    mem_uri = f"{geom_type_str}?crs={layer_info['crs'].authid()}"
+    mem_layer = QgsVectorLayer(mem_uri, layer_name, "memory")
+    mem_layer.dataProvider().addAttributes(layer_info["fields"].toList() + campi_extra)
+    mem_layer.updateFields()
+    return mem_layer
+
+
+def _aggiorna_etichetta(progress, testo):
+    """Aggiorna l'etichetta del progress solo se il testo cambia (evita repaint inutili)."""
+    if progress.labelText() != testo:
+        progress.setLabelText(testo)
+
+
+class _SegnaleCompletamento(QObject):
+    """
+    Notifica al thread principale il completamento di un job del pool:
+    il segnale emesso da un thread di lavoro arriva in coda al QEventLoop.
+    """
+
+    completato = pyqtSignal()
+
+    def collega(self, future):
+        future.add_done_callback(lambda _future: self.completato.emit())
+
+
+def _attendi_con_progress(progress, condizione_fn, testo_fn, segnale=None):
+    """Attende che `condizione_fn()` sia vera senza bloccare la GUI.
+
+    Un QEventLoop locale con QTimer a 250 ms sostituisce il vecchio ciclo
+    time.sleep(1) + processEvents(): l'etichetta del progress resta aggiornata
+    e il pulsante "Annulla" interrompe subito l'attesa.
+    Con `segnale` (_SegnaleCompletamento) l'attesa termina appena un job
+    finisce, senza aspettare il tick del timer.
+    Restituisce True se l'utente ha annullato.
+    """
+    if condizione_fn() or progress.wasCanceled():
+        return progress.wasCanceled()
+
+    loop = QEventLoop()
+    timer = QTimer()
+    timer.setInterval(250)
+
+    def _tick():
+        if condizione_fn() or progress.wasCanceled():
+            loop.quit()
+            return
+        _aggiorna_etichetta(progress, testo_fn())
+
+    timer.timeout.connect(_tick)
+    progress.canceled.connect(loop.quit)
+    if segnale is not None:
+        segnale.completato.connect(loop.quit)
+    _aggiorna_etichetta(progress, testo_fn())
+    # (un job finito prima della connect viene comunque visto dal tick successivo)
+    timer.start()
+    loop.exec()
+    timer.stop()
+    try:
+        progress.canceled.disconnect(loop.quit)
+    except TypeError:
+        pass
+    if segnale is not None:
+        try:
+            segnale.completato.disconnect(loop.quit)
+        except TypeError:
+            pass
+    return progress.wasCanceled()
 
 
 def esegui_download_e_caricamento(min_lat, min_lon, max_lat, max_lon, filter_geom=None,
@@ -449,15 +1159,24 @@ def esegui_download_e_caricamento(min_lat, min_lon, max_lat, max_lon, filter_geo
 
     # --- Filtra tile che intersecano il filtro spaziale (ottimizzazione) ---
     tiles_saltate = 0
+    filter_engine = _prepara_geometria(filter_geom) if filter_geom is not None else None
     if filter_geom is not None and n_tiles_totali > 1:
         tiles_filtrate = []
+        fg_bbox = filter_geom.boundingBox()
+        fg_min_lon, fg_min_lat = fg_bbox.xMinimum(), fg_bbox.yMinimum()
+        fg_max_lon, fg_max_lat = fg_bbox.xMaximum(), fg_bbox.yMaximum()
         for tile in tiles:
             t_min_lat, t_min_lon, t_max_lat, t_max_lon = tile
+            # Scarto rapido: tile fuori dal bbox del buffer, nessuna chiamata GEOS
+            if (t_max_lat < fg_min_lat or t_min_lat > fg_max_lat
+                    or t_max_lon < fg_min_lon or t_min_lon > fg_max_lon):
+                tiles_saltate += 1
+                continue
             # Crea geometria rettangolare della tile (in coordinate WFS/EPSG:6706)
             tile_rect = QgsRectangle(t_min_lon, t_min_lat, t_max_lon, t_max_lat)
             tile_geom = QgsGeometry.fromRect(tile_rect)
             # Verifica intersezione con il buffer
-            if tile_geom.intersects(filter_geom):
+            if filter_engine.intersects(tile_geom.constGet()):
                 tiles_filtrate.append(tile)
             else:
                 tiles_saltate += 1
@@ -525,55 +1244,112 @@ def esegui_download_e_caricamento(min_lat, min_lon, max_lat, max_lon, filter_geo
     progress.show()
     QApplication.processEvents()
 
-    # --- Download tile per tile ---
+    # --- Download tile in parallelo (rete nei thread, OGR nel thread principale) ---
     all_features = []
     layer_info = None
     errori = 0
     annullato = False
+    risultati = [None] * n_tiles
+    n_completati = 0
+    n_feature = 0
+    # Dedup per attributo applicata all'arrivo di ogni tile: le feature ripetute
+    # sui bordi tra tile adiacenti non si accumulano in memoria
+    campo_id_usato = None
+    idx_campo_id = -1
+    seen_ids = set()
+    duplicati_id = 0
 
-    for i, (t_min_lat, t_min_lon, t_max_lat, t_max_lon) in enumerate(tiles):
-        if progress.wasCanceled():
-            annullato = True
-            print("[INFO] Download annullato dall'utente.")
-            break
-
-        tile_label = f"Tile {i + 1}/{n_tiles}"
-        progress.setLabelText(
-            f"{tile_label}\n"
-            f"Feature scaricate: {len(all_features)}\n"
+    limitatore = _LimitatoreRichieste(PAUSA_SECONDI)
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(_concorrenza_wfs(), n_tiles)),
+        thread_name_prefix="wfs_tile",
+    )
+    # Filtro spaziale anche lato server (FES Intersects): meno feature da scaricare
+    _FILTRO_SERVER_RIFIUTATO.clear()
+    # (il dettaglio per tile va in console solo con DEBUG attivo)
+    print(f"\n[WFS] {n_tiles} tile in coda")
+    futures = {}
+    for i, tile in enumerate(tiles):
+        filtro = _filtro_server_tile(filter_geom, tile) if filter_geom is not None else None
+        if DEBUG:
+            t_min_lat, t_min_lon, t_max_lat, t_max_lon = tile
+            tile_area = stima_area_km2(t_min_lat, t_min_lon, t_max_lat, t_max_lon)
+            print(f"[DEBUG] Tile {i + 1}/{n_tiles} (~{tile_area:.2f} km²) in coda, "
+                  f"bbox: {t_min_lat:.7f},{t_min_lon:.7f},{t_max_lat:.7f},{t_max_lon:.7f}"
+                  + (" (con filtro spaziale)" if filtro is not None else ""))
+        futures[executor.submit(_scarica_tile_limitato, limitatore, tile, filtro)] = i
+
+    def _testo_progress():
+        return (
+            f"Tile completati: {n_completati}/{n_tiles}\n"
+            f"Feature scaricate: {n_feature}\n"
             f"Errori: {errori}"
         )
-        progress.setValue(i)
-        QApplication.processEvents()
 
-        tile_area = stima_area_km2(t_min_lat, t_min_lon, t_max_lat, t_max_lon)
-        print(f"\n--- {tile_label} (~{tile_area:.2f} km²) ---")
-        print(f"    bbox: {t_min_lat:.7f},{t_min_lon:.7f},{t_max_lat:.7f},{t_max_lon:.7f}")
-
-        features, info = scarica_singolo_tile(t_min_lat, t_min_lon, t_max_lat, t_max_lon)
+    in_sospeso = set(futures)
+    segnale = _SegnaleCompletamento()
+    for fut in futures:
+        segnale.collega(fut)
+    try:
+        while in_sospeso:
+            if _attendi_con_progress(
+                progress, lambda: any(f.done() for f in in_sospeso), _testo_progress, segnale
+            ):
+                annullato = True
+                print("[INFO] Download annullato dall'utente.")
+                break
 
-        if features is not None:
-            print(f"    [OK] {len(features)} feature(s)")
+            for fut in [f for f in in_sospeso if f.done()]:
+                in_sospeso.discard(fut)
+                i = futures[fut]
+                dati = fut.result()
+                features, info = (None, None)
+                if dati == TILE_VUOTO:
+                    features = []
+                elif dati is not None:
+                    features, info = _carica_tile_da_gml(dati)
+
+                if features is not None:
+                    if DEBUG:
+                        print(f"[DEBUG] Tile {i + 1}/{n_tiles}: {len(features)} feature(s)")
+                    n_feature += len(features)
+                    if layer_info is None and info is not None:
+                        layer_info = info
+                        campo_id_usato, idx_campo_id = _indice_campo_id(info["fields"])
+                    if idx_campo_id >= 0:
+                        unici = []
+                        for feat in features:
+                            # Una sola operazione sul set: se add() non lo fa crescere,
+                            # l'ID era già visto
+                            n_visti = len(seen_ids)
+                            seen_ids.add(feat.attribute(idx_campo_id))
+                            if len(seen_ids) > n_visti:
+                                unici.append(feat)
+                        duplicati_id += len(features) - len(unici)
+                        features = unici
+                    risultati[i] = features
+                else:
+                    errori += 1
+                    print(f"    [ERRORE] Tile {i + 1}/{n_tiles} fallito")
+
+                n_completati += 1
+                progress.setValue(n_completati)
+                _aggiorna_etichetta(progress, _testo_progress())
+    finally:
+        # Annullamento o errore: i job in coda non partono (anche quelli in attesa
+        # del turno si sbloccano subito), si attende la fine delle sole richieste
+        # già in corso, così nessun thread sopravvive al download
+        limitatore.annulla()
+        if any(not f.done() for f in in_sospeso):
+            _aggiorna_etichetta(progress, "Annullamento: attendo le richieste in corso...")
+            QApplication.processEvents()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    # Ordine stabile per tile (la dedup per ID conserva la prima occorrenza arrivata)
+    for features in risultati:
+        if features:
             all_features.extend(features)
-            if layer_info is None and info is not None:
-                layer_info = info
-        else:
-            errori += 1
-            print("    [ERRORE] Tile fallito")
-
-        # Pausa tra le chiamate (non dopo l'ultimo tile)
-        if i < n_tiles - 1 and not progress.wasCanceled():
-            for sec in range(PAUSA_SECONDI):
-                if progress.wasCanceled():
-                    annullato = True
-                    break
-                progress.setLabelText(
-                    f"{tile_label} completato\n"
-                    f"Feature scaricate: {len(all_features)}\n"
-                    f"Attesa: {PAUSA_SECONDI - sec} sec..."
-                )
-                QApplication.processEvents()
-                time.sleep(1)
+    del risultati, seen_ids
 
     progress.setValue(n_tiles)
     QApplication.processEvents()
@@ -618,73 +1394,154 @@ def esegui_download_e_caricamento(min_lat, min_lon, max_lat, max_lon, filter_geo
         print("[ERRORE] Impossibile determinare la struttura del layer.")
         return
 
-    # --- Deduplicazione feature ---
-    print("\n--- Deduplicazione ---")
-    print(f"    Feature totali scaricate: {len(all_features)}")
+    # Indici dei campi sorgente (nome -> indice), risolti una sola volta
+    idx_sorgente = _indici_campi(layer_info["fields"])
 
-    # FASE 1: Deduplicazione per attributo (gml_id, inspireid, ecc.)
-    campo_id_usato = None
-    for campo in ['gml_id', 'inspireid', 'nationalCadastralReference']:
-        idx = layer_info["fields"].indexOf(campo)
-        if idx >= 0:
-            campo_id_usato = campo
-            break
+    is_append = (append_to_layer is not None
+                 and append_to_layer.isValid()
+                 and QgsProject.instance().mapLayer(append_to_layer.id()) is not None)
 
-    seen_ids = set()
-    dopo_dedup_id = []
-    duplicati_id = 0
+    # Deduplicazione cross-click: in append si escludono le feature già presenti
+    # nel layer di destinazione (per gml_id), nello stesso passaggio della dedup.
+    # Si legge solo la colonna gml_id, senza decodificare le geometrie
+    existing_ids = set()
+    if is_append:
+        idx_gml_existing = append_to_layer.fields().indexOf("gml_id")
+        if idx_gml_existing >= 0:
+            request = (
+                QgsFeatureRequest()
+                .setFlags(Qgis.FeatureRequestFlag.NoGeometry)
+                .setSubsetOfAttributes([idx_gml_existing])
+            )
+            existing_ids = {
+                gml_val for feat in append_to_layer.getFeatures(request)
+                if (gml_val := feat.attribute(idx_gml_existing))
+            }
+    idx_gml_source = idx_sorgente.get("gml_id", -1) if existing_ids else -1
+
+    # La verifica delle geometrie duplicate serve solo se il layer di
+    # destinazione ha i campi di segnalazione (sempre presenti nei nuovi layer)
+    verifica_geom_dup = True
+    if is_append:
+        campi_append = append_to_layer.fields()
+        verifica_geom_dup = (campi_append.indexOf("geom_duplicata") >= 0
+                             or campi_append.indexOf("gruppo_duplicato") >= 0)
 
+    # --- Deduplicazione feature ---
+    print("\n--- Deduplicazione ---")
+    print(f"    Feature totali scaricate: {n_feature}")
+
+    # Campo chiave per la deduplicazione per attributo (gml_id, inspireid, ecc.),
+    # già applicata durante il download
     if campo_id_usato:
-        idx_campo = layer_info["fields"].indexOf(campo_id_usato)
         print(f"    Campo chiave per dedup: '{campo_id_usato}'")
-        for feat in all_features:
-            fid = feat.attribute(idx_campo)
-            if fid not in seen_ids:
-                seen_ids.add(fid)
-                dopo_dedup_id.append(feat)
-            else:
-                duplicati_id += 1
     else:
         print("    [AVVISO] Nessun campo ID trovato, salto dedup per attributo")
-        dopo_dedup_id = list(all_features)
+
+    # Tutti i punti in un'unica MultiPoint preparata: un test GEOS per feature
+    engine_punti = None
+    indice_punti = None
+    parti_punti = None
+    if post_filter_points:
+        punti = QgsGeometry.collectGeometry(post_filter_points)
+        bbox_punti = punti.boundingBox()
+        parti_punti = punti.asGeometryCollection()
+        if len(parti_punti) > SOGLIA_INDICE_PUNTI:
+            # Molti punti: il test GEOS sulla MultiPoint scorrerebbe tutti i punti
+            # per ogni particella; l'indice riduce il test ai punti nel suo bbox
+            indice_punti = QgsSpatialIndex()
+            for i, pt in enumerate(parti_punti):
+                indice_punti.addFeature(i, pt.boundingBox())
+        else:
+            engine_punti = _prepara_geometria(punti)
+    # Scarto rapido per bbox prima dei test GEOS
+    bbox_filtro = filter_geom.boundingBox() if filter_engine is not None else None
+
+    # FASE 2-3: filtro spaziale (linea / punti), filtro puntuale e
+    # raggruppamento per bbox in un unico passaggio sulle feature.
+    # Le geometrie duplicate (stessa geometria, ID diverso) vengono MANTENUTE
+    # tutte, ma segnalate con un campo attributo
+    cross_dup = 0
+    n_nel_bbox = len(all_features)
+    n_nel_buffer = 0
+    dopo_dedup_id = []
+    # bbox arrotondato a 6 decimali -> lista di indici in dopo_dedup_id
+    # (geometrie identiche hanno per forza lo stesso bbox)
+    gruppi_bbox = {}
+
+    for feat in all_features:
+        geom = feat.geometry()
+        vuota = geom.isNull() or geom.isEmpty()
+        if filter_engine is not None and (
+                vuota or not geom.boundingBoxIntersects(bbox_filtro)
+                or not filter_engine.intersects(geom.constGet())):
+            continue
+        n_nel_buffer += 1
+        if post_filter_points is not None and (
+                vuota or not parti_punti or not geom.boundingBoxIntersects(bbox_punti)
+                or not _interseca_punti(geom, engine_punti, indice_punti, parti_punti)):
+            continue
+        if idx_gml_source >= 0 and feat.attribute(idx_gml_source) in existing_ids:
+            cross_dup += 1
+            continue
+
+        nuovo_idx = len(dopo_dedup_id)
+        dopo_dedup_id.append(feat)
+        if vuota or not verifica_geom_dup:
+            continue
+        bbox = geom.boundingBox()
+        chiave_bbox = (
+            round(bbox.xMinimum(), 6), round(bbox.yMinimum(), 6),
+            round(bbox.xMaximum(), 6), round(bbox.yMaximum(), 6),
+        )
+        gruppi_bbox.setdefault(chiave_bbox, []).append(nuovo_idx)
+    del existing_ids
+    filtrate_spaziale = n_nel_bbox - n_nel_buffer
+    filtrate_punti = n_nel_buffer - len(dopo_dedup_id) - cross_dup
 
     if duplicati_id > 0:
         print(f"    Duplicati per attributo rimossi: {duplicati_id}")
     else:
         print("    Nessun duplicato per attributo")
 
-    # FASE 2: Verifica geometrie duplicate (stessa geometria, ID diverso)
-    # Le feature vengono MANTENUTE tutte, ma segnalate con un campo attributo
-    print("\n--- Verifica geometrie duplicate ---")
-    seen_geom = {}  # wkt -> lista di indici in dopo_dedup_id
+    if filter_geom is not None:
+        print("\n--- Filtro spaziale (intersezione con buffer) ---")
+        print(f"    Feature nel bbox:              {n_nel_bbox}")
+        print(f"    Feature che intersecano buffer: {n_nel_buffer}")
+        print(f"    Feature escluse:               {filtrate_spaziale}")
 
-    for i, feat in enumerate(dopo_dedup_id):
-        geom = feat.geometry()
-        if geom.isNull() or geom.isEmpty():
-            continue
-        wkt = geom.asWkt(precision=6)
-        if wkt in seen_geom:
-            seen_geom[wkt].append(i)
-        else:
-            seen_geom[wkt] = [i]
+    if post_filter_points is not None:
+        print("\n--- Filtro puntuale (point-in-polygon) ---")
+        print(f"    Feature dopo filtro buffer:    {n_nel_buffer}")
+        print(f"    Feature che contengono punti:  {n_nel_buffer - filtrate_punti}")
+        print(f"    Feature escluse:               {filtrate_punti}")
 
-    # Mappa indice feature -> (è_duplicata, numero_gruppo)
-    geom_dup_map = {}
+    if verifica_geom_dup:
+        print("\n--- Verifica geometrie duplicate ---")
+
+    # Il confronto delle geometrie è limitato alle feature con lo stesso bbox
     geom_duplicati_gruppi = []
+    for indici_bbox in gruppi_bbox.values():
+        if len(indici_bbox) < 2:
+            continue
+        seen_geom = {}  # chiave geometria -> lista di indici in dopo_dedup_id
+        for idx in indici_bbox:
+            chiave = _chiave_geometria(dopo_dedup_id[idx].geometry())
+            seen_geom.setdefault(chiave, []).append(idx)
+        geom_duplicati_gruppi.extend(g for g in seen_geom.values() if len(g) > 1)
+    geom_duplicati_gruppi.sort(key=lambda indici: indici[0])
+
+    # Mappa indice feature -> (è_duplicata, numero_gruppo), solo per le duplicate
+    geom_dup_map = {}
     duplicati_geom = 0
-    gruppo_num = 0
-
-    for wkt, indici in seen_geom.items():
-        if len(indici) > 1:
-            gruppo_num += 1
-            duplicati_geom += len(indici)
-            geom_duplicati_gruppi.append(indici)
-            for idx in indici:
-                geom_dup_map[idx] = (True, gruppo_num)
-        else:
-            geom_dup_map[indici[0]] = (False, 0)
-
-    if duplicati_geom > 0:
+    for gruppo_num, indici in enumerate(geom_duplicati_gruppi, start=1):
+        duplicati_geom += len(indici)
+        for idx in indici:
+            geom_dup_map[idx] = (True, gruppo_num)
+
+    if not verifica_geom_dup:
+        print("\n    Verifica geometrie duplicate saltata (campi assenti nel layer di destinazione)")
+    elif duplicati_geom > 0:
         print(f"    [ATTENZIONE] {duplicati_geom} feature con geometria duplicata!")
         print(f"    Gruppi di geometrie identiche: {len(geom_duplicati_gruppi)}")
         for g_idx, indici in enumerate(geom_duplicati_gruppi[:10]):
@@ -692,8 +1549,7 @@ def esegui_download_e_caricamento(min_lat, min_lon, max_lat, max_lon, filter_geo
             for idx in indici:
                 f = dopo_dedup_id[idx]
                 if campo_id_usato:
-                    idx_campo = layer_info["fields"].indexOf(campo_id_usato)
-                    ids_nel_gruppo.append(str(f.attribute(idx_campo)))
+                    ids_nel_gruppo.append(str(f.attribute(idx_campo_id)))
                 else:
                     ids_nel_gruppo.append(str(f.id()))
             bbox_g = dopo_dedup_id[indici[0]].geometry().boundingBox()
@@ -707,75 +1563,16 @@ def esegui_download_e_caricamento(min_lat, min_lon, max_lat, max_lon, filter_geo
 
     # Riepilogo deduplicazione
     print("\n    --- Riepilogo ---")
-    print(f"    Feature iniziali:              {len(all_features)}")
+    print(f"    Feature iniziali:              {n_feature}")
     print(f"    Duplicati per attributo:        {duplicati_id} (rimossi)")
     print(f"    Geometrie duplicate:            {duplicati_geom} (mantenute, segnalate)")
     print(f"    Feature finali:                 {len(dopo_dedup_id)}")
-
-    # --- FASE 3: Filtro spaziale (opzionale, per linea / punti) ---
-    filtrate_spaziale = 0
-    filtrate_punti = 0
-    if filter_geom is not None:
-        print("\n--- Filtro spaziale (intersezione con buffer) ---")
-        features_filtrate = []
-        nuova_geom_dup_map = {}
-
-        for i, feat in enumerate(dopo_dedup_id):
-            geom = feat.geometry()
-            if geom.isNull() or geom.isEmpty():
-                continue
-            if geom.intersects(filter_geom):
-                nuovo_idx = len(features_filtrate)
-                features_filtrate.append(feat)
-                # Mantieni info duplicati con nuovo indice
-                if i in geom_dup_map:
-                    nuova_geom_dup_map[nuovo_idx] = geom_dup_map[i]
-
-        filtrate_spaziale = len(dopo_dedup_id) - len(features_filtrate)
-        print(f"    Feature nel bbox:              {len(dopo_dedup_id)}")
-        print(f"    Feature che intersecano buffer: {len(features_filtrate)}")
-        print(f"    Feature escluse:               {filtrate_spaziale}")
-
-        dopo_dedup_id = features_filtrate
-        geom_dup_map = nuova_geom_dup_map
-
-    # --- FASE 3b: Filtro puntuale (point-in-polygon, per modalità Punti) ---
-    if post_filter_points is not None:
-        print("\n--- Filtro puntuale (point-in-polygon) ---")
-        features_con_punto = []
-        nuova_geom_dup_map_2 = {}
-
-        for i, feat in enumerate(dopo_dedup_id):
-            geom = feat.geometry()
-            if geom.isNull() or geom.isEmpty():
-                continue
-            contiene_punto = False
-            for pt_geom in post_filter_points:
-                if geom.intersects(pt_geom):
-                    contiene_punto = True
-                    break
-            if contiene_punto:
-                nuovo_idx = len(features_con_punto)
-                features_con_punto.append(feat)
-                if i in geom_dup_map:
-                    nuova_geom_dup_map_2[nuovo_idx] = geom_dup_map[i]
-
-        filtrate_punti = len(dopo_dedup_id) - len(features_con_punto)
-        print(f"    Feature dopo filtro buffer:    {len(dopo_dedup_id)}")
-        print(f"    Feature che contengono punti:  {len(features_con_punto)}")
-        print(f"    Feature escluse:               {filtrate_punti}")
-
-        dopo_dedup_id = features_con_punto
-        geom_dup_map = nuova_geom_dup_map_2
+    del all_features  # le feature sopravvissute restano referenziate da dopo_dedup_id
 
     # Tutte le feature vengono mantenute
     unique_features = dopo_dedup_id
 
     # --- Modalità append o creazione nuovo layer ---
-    is_append = (append_to_layer is not None
-                 and append_to_layer.isValid()
-                 and QgsProject.instance().mapLayer(append_to_layer.id()) is not None)
-
     if is_append:
         # --- Append a layer esistente ---
         mem_layer = append_to_layer
@@ -784,59 +1581,48 @@ def esegui_download_e_caricamento(min_lat, min_lon, max_lat, max_lon, filter_geo
         print(f"\n--- Append a layer esistente: {mem_layer.name()} ---")
         print(f"    Feature già presenti: {mem_layer.featureCount()}")
 
-        # Deduplicazione cross-click: escludi feature già presenti (per gml_id)
-        existing_ids = set()
-        idx_gml_existing = mem_layer.fields().indexOf("gml_id")
-        if idx_gml_existing >= 0:
-            for feat in mem_layer.getFeatures():
-                gml_val = feat.attribute(idx_gml_existing)
-                if gml_val:
-                    existing_ids.add(gml_val)
-
-        idx_gml_source = layer_info["fields"].indexOf("gml_id")
-        pre_dedup = len(unique_features)
-        if existing_ids and idx_gml_source >= 0:
-            unique_features = [
-                f for f in unique_features
-                if f.attribute(idx_gml_source) not in existing_ids
-            ]
-            cross_dup = pre_dedup - len(unique_features)
-            if cross_dup > 0:
-                print(f"    Duplicati cross-click rimossi: {cross_dup}")
+        if cross_dup > 0:
+            print(f"    Duplicati cross-click rimossi: {cross_dup}")
 
     else:
         # --- Crea layer temporaneo in memoria ---
         print("\n--- Creazione layer temporaneo ---")
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         layer_name = f"{layer_name}_{timestamp}"
-        geom_type_str = _wkb_display_string(layer_info["wkb_type"])
         crs = layer_info["crs"]
-        mem_uri = f"{geom_type_str}?crs={crs.authid()}"
 
-        mem_layer = QgsVectorLayer(mem_uri, layer_name, "memory")
+        # Campi originali + campi segnalazione duplicati (+ campi catastali)
+        campi_extra = [
+            QgsField("geom_duplicata", QMetaType.Type.QString),
+            QgsField("gruppo_duplicato", QMetaType.Type.Int),
+        ]
+        if espandi_catastale:
+            campi_extra += [
+                QgsField("sezione", QMetaType.Type.QString),
+                QgsField("foglio", QMetaType.Type.Int),
+                QgsField("allegato", QMetaType.Type.QString),
+                QgsField("sviluppo", QMetaType.Type.QString),
+            ]
+        mem_layer = _crea_layer_memoria(layer_info, layer_name, campi_extra)
         mem_provider = mem_layer.dataProvider()
 
-        # Copia campi originali + aggiungi campi segnalazione duplicati
-        original_fields = layer_info["fields"].toList()
-        original_fields.append(QgsField("geom_duplicata", QMetaType.Type.QString))
-        original_fields.append(QgsField("gruppo_duplicato", QMetaType.Type.Int))
-        if espandi_catastale:
-            original_fields.append(QgsField("sezione", QMetaType.Type.QString))
-            original_fields.append(QgsField("foglio", QMetaType.Type.Int))
-            original_fields.append(QgsField("allegato", QMetaType.Type.QString))
-            original_fields.append(QgsField("sviluppo", QMetaType.Type.QString))
-        mem_provider.addAttributes(original_fields)
-        mem_layer.updateFields()
-
-    # Indici dei nuovi campi
-    idx_geom_dup = mem_layer.fields().indexOf("geom_duplicata")
-    idx_gruppo_dup = mem_layer.fields().indexOf("gruppo_duplicato")
+    # Indici dei campi di destinazione, risolti una sola volta
+    campi_dest = mem_layer.fields()
+    idx_dest = _indici_campi(campi_dest)
+    idx_geom_dup = idx_dest.get("geom_duplicata", -1)
+    idx_gruppo_dup = idx_dest.get("gruppo_duplicato", -1)
+    # Coppie (indice sorgente, indice destinazione) dei campi originali da copiare
+    copia_attributi = [
+        (src_idx, idx_dest[nome])
+        for nome, src_idx in idx_sorgente.items()
+        if nome in idx_dest
+    ]
     if espandi_catastale:
-        idx_sezione = mem_layer.fields().indexOf("sezione")
-        idx_foglio = mem_layer.fields().indexOf("foglio")
-        idx_allegato = mem_layer.fields().indexOf("allegato")
-        idx_sviluppo = mem_layer.fields().indexOf("sviluppo")
-        idx_ncr = layer_info["fields"].indexOf("NATIONALCADASTRALREFERENCE")
+        idx_sezione = idx_dest.get("sezione", -1)
+        idx_foglio = idx_dest.get("foglio", -1)
+        idx_allegato = idx_dest.get("allegato", -1)
+        idx_sviluppo = idx_dest.get("sviluppo", -1)
+        idx_ncr = idx_sorgente.get("NATIONALCADASTRALREFERENCE", -1)
         # In append: avvisa se il layer esistente non ha i campi espansi
         if is_append and any(i < 0 for i in [idx_sezione, idx_foglio, idx_allegato, idx_sviluppo]):
             risposta = QMessageBox.warning(
@@ -854,46 +1640,58 @@ def esegui_download_e_caricamento(min_lat, min_lon, max_lat, max_lon, filter_geo
                 return None
 
     # Copia feature con attributi di segnalazione
+    # (lista attributi costruita in Python e assegnata con un solo setAttributes)
+    # Modello degli attributi con i valori di default (feature non duplicata),
+    # copiato per ogni feature; i campi originali e catastali vengono sovrascritti
+    attrs_base = [None] * campi_dest.count()
+    if idx_geom_dup >= 0:
+        attrs_base[idx_geom_dup] = "no"
     new_features = []
+    n_aggiunte = 0
     for i, feat in enumerate(unique_features):
-        new_feat = QgsFeature(mem_layer.fields())
-        new_feat.setGeometry(feat.geometry())
+        unique_features[i] = None  # la feature sorgente si libera dopo l'inserimento del blocco
+        src_attrs = feat.attributes()
+        attrs = attrs_base.copy()
 
         # Copia attributi originali
-        for field_idx in range(layer_info["fields"].count()):
-            field_name = layer_info["fields"].field(field_idx).name()
-            new_field_idx = mem_layer.fields().indexOf(field_name)
-            if new_field_idx >= 0:
-                new_feat.setAttribute(new_field_idx, feat.attribute(field_idx))
+        for src_idx, dst_idx in copia_attributi:
+            attrs[dst_idx] = src_attrs[src_idx]
 
         # Imposta segnalazione duplicato
-        is_dup, grp = geom_dup_map.get(i, (False, 0))
-        new_feat.setAttribute(idx_geom_dup, "si" if is_dup else "no")
-        new_feat.setAttribute(idx_gruppo_dup, grp if is_dup else None)
+        dup = geom_dup_map.get(i)
+        if dup is not None:
+            if idx_geom_dup >= 0:
+                attrs[idx_geom_dup] = "si"
+            if idx_gruppo_dup >= 0:
+                attrs[idx_gruppo_dup] = dup[1]
 
         # Parsing NATIONALCADASTRALREFERENCE (formato CCCCZFFFFAS.particella)
         if espandi_catastale and idx_ncr >= 0:
-            ncr = feat.attribute(idx_ncr)
-            if ncr and isinstance(ncr, str):
-                codice = ncr.split(".")[0]  # parte prima del punto
-                if len(codice) == 11:  # CCCCZFFFFAS = 11 caratteri
-                    sez = codice[4]  # Z: sezione censuaria
-                    if idx_sezione >= 0:
-                        new_feat.setAttribute(idx_sezione, "" if sez == "_" else sez)
-                    try:
-                        if idx_foglio >= 0:
-                            new_feat.setAttribute(idx_foglio, int(codice[5:9]))
-                    except ValueError:
-                        if idx_foglio >= 0:
-                            new_feat.setAttribute(idx_foglio, None)
-                    if idx_allegato >= 0:
-                        new_feat.setAttribute(idx_allegato, codice[9])
-                    if idx_sviluppo >= 0:
-                        new_feat.setAttribute(idx_sviluppo, codice[10])
-
+            parti_ncr = _espandi_ncr(src_attrs[idx_ncr])
+            if parti_ncr is not None:
+                sez, foglio, allegato, sviluppo = parti_ncr
+                if idx_sezione >= 0:
+                    attrs[idx_sezione] = sez
+                if idx_foglio >= 0:
+                    attrs[idx_foglio] = foglio
+                if idx_allegato >= 0:
+                    attrs[idx_allegato] = allegato
+                if idx_sviluppo >= 0:
+                    attrs[idx_sviluppo] = sviluppo
+
+        new_feat = QgsFeature(campi_dest)
+        new_feat.setGeometry(feat.geometry())
+        new_feat.setAttributes(attrs)
         new_features.append(new_feat)
-
-    mem_provider.addFeatures(new_features)
+        if len(new_features) >= BLOCCO_INSERIMENTO:
+            mem_provider.addFeatures(new_features, QgsFeatureSink.Flag.FastInsert)
+            n_aggiunte += len(new_features)
+            new_features = []
+
+    if new_features:
+        mem_provider.addFeatures(new_features, QgsFeatureSink.Flag.FastInsert)
+        n_aggiunte += len(new_features)
+    del new_features
     mem_layer.updateExtents()
 
     if not is_append:
@@ -917,7 +1715,6 @@ def esegui_download_e_caricamento(min_lat, min_lon, max_lat, max_lon, filter_geo
     feat_count = mem_layer.featureCount()
 
     if is_append:
-        n_aggiunte = len(new_features)
         print(f"[OK] Aggiunte {n_aggiunte} feature (totale: {feat_count})")
         # Re-applica lo stile: resetta i conteggi interni del renderer rule-based
         # (necessario perché setCustomProperty("showFeatureCount", True) non rilancia
@@ -958,24 +1755,26 @@ def esegui_download_e_caricamento(min_lat, min_lon, max_lat, max_lon, filter_geo
 
     # Zoom sul layer (trasforma extent nel CRS del progetto)
     canvas = qgis_iface.mapCanvas()
-    project_crs = QgsProject.instance().crs()
+    project_crs = _crs_progetto()
     layer_extent = mem_layer.extent()
 
-    if crs.authid() != project_crs.authid():
-        transform_to_project = QgsCoordinateTransform(
-            crs, project_crs, QgsProject.instance()
-        )
-        extent_proj = transform_to_project.transformBoundingBox(layer_extent)
+    if not _stesso_crs(crs, project_crs):
+        extent_proj = _get_xform(crs, project_crs).transformBoundingBox(layer_extent)
     else:
         extent_proj = layer_extent
 
     extent_proj.scale(1.05)  # margine del 5%
-    canvas.setExtent(extent_proj)
-    canvas.refresh()
+    # Canvas congelato durante zoom e aggiunta del WMS: un solo render finale
+    canvas.freeze(True)
+    try:
+        canvas.setExtent(extent_proj)
 
-    # Carica WMS Catasto se richiesto
-    if carica_wms:
-        carica_wms_catasto()
+        # Carica WMS Catasto se richiesto
+        if carica_wms:
+            carica_wms_catasto()
+    finally:
+        canvas.freeze(False)
+        canvas.refresh()
 
     # Riepilogo finale
     print("\n" + "=" * 60)
@@ -1005,6 +1804,11 @@ def esegui_download_e_caricamento(min_lat, min_lon, max_lat, max_lon, filter_geo
 # TOOL 1: DISEGNA BBOX (due click)
 # =============================================================================
 
+# Colori anteprima bbox, creati una sola volta
+_BBOX_PREVIEW_FILL = QColor(0, 120, 255, 40)
+_BBOX_PREVIEW_BORDO = QColor(0, 120, 255, 180)
+
+
 class BBoxDrawTool(QgsMapTool):
     """
     Tool interattivo: clicca il primo angolo, anteprima in tempo reale,
@@ -1025,22 +1829,19 @@ class BBoxDrawTool(QgsMapTool):
 
     def _create_preview_rubberband(self):
         self.preview_rb = QgsRubberBand(self.canvas, _GEOM_POLYGON)
-        self.preview_rb.setColor(QColor(0, 120, 255, 40))
-        self.preview_rb.setStrokeColor(QColor(0, 120, 255, 180))
+        self.preview_rb.setColor(_BBOX_PREVIEW_FILL)
+        self.preview_rb.setStrokeColor(_BBOX_PREVIEW_BORDO)
         self.preview_rb.setWidth(2)
         self.preview_rb.setLineStyle(_DashLine)
 
     def _update_preview(self, second_point):
         if not self.first_point:
             return
-        self.preview_rb.reset(_GEOM_POLYGON)
         p1 = self.first_point
         p2 = second_point
-        self.preview_rb.addPoint(QgsPointXY(p1.x(), p1.y()))
-        self.preview_rb.addPoint(QgsPointXY(p2.x(), p1.y()))
-        self.preview_rb.addPoint(QgsPointXY(p2.x(), p2.y()))
-        self.preview_rb.addPoint(QgsPointXY(p1.x(), p2.y()))
-        self.preview_rb.addPoint(QgsPointXY(p1.x(), p1.y()))
+        # Un solo setToGeometry al posto di reset + 5 addPoint (chiamato a ogni mouse move)
+        rect = QgsRectangle(p1.x(), p1.y(), p2.x(), p2.y())
+        self.preview_rb.setToGeometry(QgsGeometry.fromRect(rect))
         self.preview_rb.show()
 
     def canvasPressEvent(self, event):
@@ -1054,9 +1855,8 @@ class BBoxDrawTool(QgsMapTool):
             second_point = point
             print(f"[BBOX] Secondo angolo: ({second_point.x():.6f}, {second_point.y():.6f})")
 
-            # Rimuovi anteprima
+            # Nascondi anteprima (il rubberband esce dalla scena in deactivate)
             self.preview_rb.reset()
-            self.canvas.scene().removeItem(self.preview_rb)
 
             # Calcola rettangolo
             rect = QgsRectangle(
@@ -1067,7 +1867,7 @@ class BBoxDrawTool(QgsMapTool):
             )
 
             # Trasforma e scarica
-            project_crs = QgsProject.instance().crs()
+            project_crs = _crs_progetto()
             print(f"\n[CRS] CRS del progetto: {project_crs.authid()}")
             min_lat, min_lon, max_lat, max_lon = trasforma_bbox_a_wfs(rect, project_crs)
             esegui_download_e_caricamento(
@@ -1102,6 +1902,7 @@ class BBoxDrawTool(QgsMapTool):
                 self.canvas.scene().removeItem(self.preview_rb)
             except Exception:
                 pass
+            self.preview_rb = None
         super().deactivate()
 
 
@@ -1123,39 +1924,45 @@ class PolySelectTool(QgsMapTool):
         self.espandi_catastale = espandi_catastale
         self.carica_wms = carica_wms
         self.append_to_layer = append_to_layer
+        self._ultimo_click = 0.0
+        self._download_in_corso = False
 
     def canvasPressEvent(self, event):
-        click_map_point = self.toMapCoordinates(event.pos())
-        project_crs = QgsProject.instance().crs()
+        # Ignora click ravvicinati (doppio click) e click durante un download
+        ora = time.monotonic()
+        if self._download_in_corso or ora - self._ultimo_click < DEBOUNCE_CLICK_SECONDI:
+            return
+        self._ultimo_click = ora
 
-        print(f"\n[DEBUG] Click alle coordinate progetto ({project_crs.authid()}): "
-              f"({click_map_point.x():.6f}, {click_map_point.y():.6f})")
+        click_map_point = self.toMapCoordinates(event.pos())
+        project_crs = _crs_progetto()
 
-        poly_layers = []
-        for lyr in QgsProject.instance().mapLayers().values():
-            if isinstance(lyr, QgsVectorLayer) and _is_polygon_layer(lyr):
-                poly_layers.append(lyr.name())
-        print(f"[DEBUG] Layer poligonali trovati: {poly_layers if poly_layers else 'NESSUNO'}")
+        poly_layers = _layer_vettoriali(_is_polygon_layer)
+        if DEBUG:
+            print(f"\n[DEBUG] Click alle coordinate progetto ({project_crs.authid()}): "
+                  f"({click_map_point.x():.6f}, {click_map_point.y():.6f})")
+            nomi = [lyr.name() for lyr in poly_layers]
+            print(f"[DEBUG] Layer poligonali trovati: {nomi if nomi else 'NESSUNO'}")
 
         found = False
-        for layer in QgsProject.instance().mapLayers().values():
-            if not isinstance(layer, QgsVectorLayer):
-                continue
-            if not _is_polygon_layer(layer):
-                continue
+        for layer in poly_layers:
 
             layer_crs = layer.crs()
+            stesso_crs = _stesso_crs(layer_crs, project_crs)
 
-            if project_crs.authid() != layer_crs.authid():
-                to_layer = QgsCoordinateTransform(
-                    project_crs, layer_crs, QgsProject.instance()
-                )
+            if not stesso_crs:
+                to_layer = _get_xform(project_crs, layer_crs)
                 click_layer_point = to_layer.transform(click_map_point)
             else:
                 click_layer_point = click_map_point
 
+            # Il click deve cadere dentro un poligono: se è fuori dall'extent
+            # del layer si salta subito, senza rettangolo né richiesta
+            if not layer.extent().contains(click_layer_point):
+                continue
+
             tolerance = self.canvas.mapUnitsPerPixel() * 10
-            if project_crs.authid() != layer_crs.authid():
+            if not stesso_crs:
                 tolerance_layer = tolerance * 2
             else:
                 tolerance_layer = tolerance
@@ -1167,54 +1974,57 @@ class PolySelectTool(QgsMapTool):
                 click_layer_point.y() + tolerance_layer,
             )
 
-            request = QgsFeatureRequest().setFilterRect(search_rect)
-            click_geom = QgsGeometry.fromPointXY(click_layer_point)
+            request = _richiesta_feature_nel_rect(layer, search_rect)
+            # Punto click preparato una volta, riusato per tutti i candidati
+            click_engine = _prepara_geometria(QgsGeometry.fromPointXY(click_layer_point))
 
             for feat in layer.getFeatures(request):
                 geom = feat.geometry()
-                if geom.isNull() or geom.isEmpty():
-                    continue
-                if not geom.contains(click_geom):
+                # Scarto per bbox (il rettangolo di ricerca include la tolleranza)
+                # prima del test GEOS punto-in-poligono
+                if (geom.isEmpty() or not geom.boundingBox().contains(click_layer_point)
+                        or not click_engine.within(geom.constGet())):
                     continue
 
                 found = True
                 feat_id = feat.id()
                 layer_name = layer.name()
 
-                print("\n[POLIGONO] Feature selezionata:")
-                print(f"           Layer: {layer_name}")
-                print(f"           Feature ID: {feat_id}")
-                print(f"           CRS del layer: {layer_crs.authid()}")
-
+                # Un solo print per blocco (ogni print è un messaggio nella console QGIS)
                 bbox = geom.boundingBox()
-                print(f"[POLIGONO] BBox geometria ({layer_crs.authid()}):")
-                print(f"           xMin={bbox.xMinimum():.7f}, yMin={bbox.yMinimum():.7f}")
-                print(f"           xMax={bbox.xMaximum():.7f}, yMax={bbox.yMaximum():.7f}")
-
-                print(f"\n[CRS] CRS del layer sorgente: {layer_crs.authid()}")
+                layer_authid = layer_crs.authid()
+                print(
+                    "\n[POLIGONO] Feature selezionata:\n"
+                    f"           Layer: {layer_name}\n"
+                    f"           Feature ID: {feat_id}\n"
+                    f"           CRS del layer: {layer_authid}\n"
+                    f"[POLIGONO] BBox geometria ({layer_authid}):\n"
+                    f"           xMin={bbox.xMinimum():.7f}, yMin={bbox.yMinimum():.7f}\n"
+                    f"           xMax={bbox.xMaximum():.7f}, yMax={bbox.yMaximum():.7f}\n"
+                    f"\n[CRS] CRS del layer sorgente: {layer_authid}"
+                )
                 min_lat, min_lon, max_lat, max_lon = trasforma_bbox_a_wfs(
                     bbox, layer_crs
                 )
 
                 # Trasforma la geometria del poligono in EPSG:6706 per il filtering
-                wfs_crs = QgsCoordinateReferenceSystem(WFS_CRS_ID)
-                if layer_crs.authid() != wfs_crs.authid():
-                    transform_to_wfs = QgsCoordinateTransform(
-                        layer_crs, wfs_crs, QgsProject.instance()
+                if not _stesso_crs(layer_crs, _WFS_CRS):
+                    # geom non serve più dopo il bbox: trasformazione sul posto
+                    geom.transform(_get_xform(layer_crs, _WFS_CRS))
+                poly_geom_wfs = geom
+
+                self._download_in_corso = True
+                try:
+                    esegui_download_e_caricamento(
+                        min_lat, min_lon, max_lat, max_lon,
+                        filter_geom=poly_geom_wfs,
+                        layer_name="Particelle WFS (Poligono)",
+                        espandi_catastale=self.espandi_catastale,
+                        carica_wms=self.carica_wms,
+                        append_to_layer=self.append_to_layer,
                     )
-                    poly_geom_wfs = QgsGeometry(geom)
-                    poly_geom_wfs.transform(transform_to_wfs)
-                else:
-                    poly_geom_wfs = geom
-
-                esegui_download_e_caricamento(
-                    min_lat, min_lon, max_lat, max_lon,
-                    filter_geom=poly_geom_wfs,
-                    layer_name="Particelle WFS (Poligono)",
-                    espandi_catastale=self.espandi_catastale,
-                    carica_wms=self.carica_wms,
-                    append_to_layer=self.append_to_layer,
-                )
+                finally:
+                    self._download_in_corso = False
 
                 qgis_iface.actionPan().trigger()
                 if self.on_completed:
@@ -1259,30 +2069,24 @@ class LineSelectTool(QgsMapTool):
         self._draw_points = []  # Vertici della polilinea in coordinate mappa
         self._draw_rb = None    # Rubberband per la polilinea in costruzione
         self._drawing = False   # True quando si sta disegnando
+        self._ultimo_click = 0.0
+        self._download_in_corso = False
 
     def _visualizza_buffer(self, buffer_geom, buffer_crs):
-        """Visualizza il buffer sulla mappa."""
-        # Rimuovi eventuale rubberband precedente
-        if self.buffer_rb:
-            self.canvas.scene().removeItem(self.buffer_rb)
-            self.buffer_rb = None
-
+        """
+        Visualizza il buffer sulla mappa. Il rubberband viene creato alla prima
+        selezione e riusato per le successive (rimosso dalla scena in deactivate).
+        """
         # Trasforma nel CRS del progetto se necessario
-        project_crs = QgsProject.instance().crs()
-        if buffer_crs.authid() != project_crs.authid():
-            transform = QgsCoordinateTransform(
-                buffer_crs, project_crs, QgsProject.instance()
-            )
-            buffer_geom_proj = QgsGeometry(buffer_geom)
-            buffer_geom_proj.transform(transform)
-        else:
-            buffer_geom_proj = buffer_geom
-
-        # Crea rubberband arancione per il buffer
-        self.buffer_rb = QgsRubberBand(self.canvas, _GEOM_POLYGON)
-        self.buffer_rb.setColor(QColor(255, 140, 0, 60))
-        self.buffer_rb.setStrokeColor(QColor(255, 100, 0, 200))
-        self.buffer_rb.setWidth(2)
+        project_crs = _crs_progetto()
+        buffer_geom_proj = _geometria_in_crs(buffer_geom, buffer_crs, project_crs)
+
+        # Rubberband arancione per il buffer
+        if self.buffer_rb is None:
+            self.buffer_rb = QgsRubberBand(self.canvas, _GEOM_POLYGON)
+            self.buffer_rb.setColor(QColor(255, 140, 0, 60))
+            self.buffer_rb.setStrokeColor(QColor(255, 100, 0, 200))
+            self.buffer_rb.setWidth(2)
         self.buffer_rb.setToGeometry(buffer_geom_proj, None)
         self.buffer_rb.show()
 
@@ -1290,42 +2094,43 @@ class LineSelectTool(QgsMapTool):
         """Crea buffer dalla linea ed esegue il download WFS."""
         buffer_geom = line_geom.buffer(self.buffer_distance, 8)
 
-        print(f"[BUFFER] Creato buffer di {self.buffer_distance}m")
-        print(f"         Area buffer: ~{buffer_geom.area():.1f} m²")
-
         # Visualizza il buffer sulla mappa
         self._visualizza_buffer(buffer_geom, geom_crs)
 
         # Estrai bbox dal buffer
         bbox = buffer_geom.boundingBox()
-        print(f"[BUFFER] BBox del buffer ({geom_crs.authid()}):")
-        print(f"         xMin={bbox.xMinimum():.7f}, yMin={bbox.yMinimum():.7f}")
-        print(f"         xMax={bbox.xMaximum():.7f}, yMax={bbox.yMaximum():.7f}")
+        geom_authid = geom_crs.authid()
+        print(
+            f"[BUFFER] Creato buffer di {self.buffer_distance}m\n"
+            f"         Area buffer: ~{buffer_geom.area():.1f} m²\n"
+            f"[BUFFER] BBox del buffer ({geom_authid}):\n"
+            f"         xMin={bbox.xMinimum():.7f}, yMin={bbox.yMinimum():.7f}\n"
+            f"         xMax={bbox.xMaximum():.7f}, yMax={bbox.yMaximum():.7f}\n"
+            f"\n[CRS] CRS del layer sorgente: {geom_authid}"
+        )
 
         # Trasforma bbox e buffer per WFS
-        print(f"\n[CRS] CRS del layer sorgente: {geom_crs.authid()}")
         min_lat, min_lon, max_lat, max_lon = trasforma_bbox_a_wfs(bbox, geom_crs)
 
         # Trasforma il buffer nel CRS WFS per il filtering
-        wfs_crs = QgsCoordinateReferenceSystem(WFS_CRS_ID)
-        if geom_crs.authid() != wfs_crs.authid():
-            transform_to_wfs = QgsCoordinateTransform(
-                geom_crs, wfs_crs, QgsProject.instance()
-            )
-            buffer_geom_wfs = QgsGeometry(buffer_geom)
-            buffer_geom_wfs.transform(transform_to_wfs)
-        else:
-            buffer_geom_wfs = buffer_geom
+        if not _stesso_crs(geom_crs, _WFS_CRS):
+            # buffer_geom non serve più: trasformazione sul posto, senza copia
+            buffer_geom.transform(_get_xform(geom_crs, _WFS_CRS))
+        buffer_geom_wfs = buffer_geom
 
         # Esegui download con filtro buffer
-        esegui_download_e_caricamento(
-            min_lat, min_lon, max_lat, max_lon,
-            filter_geom=buffer_geom_wfs,
-            layer_name=f"Particelle WFS (Linea buffer {self.buffer_distance} m)",
-            espandi_catastale=self.espandi_catastale,
-            carica_wms=self.carica_wms,
-            append_to_layer=self.append_to_layer,
-        )
+        self._download_in_corso = True
+        try:
+            esegui_download_e_caricamento(
+                min_lat, min_lon, max_lat, max_lon,
+                filter_geom=buffer_geom_wfs,
+                layer_name=f"Particelle WFS (Linea buffer {self.buffer_distance} m)",
+                espandi_catastale=self.espandi_catastale,
+                carica_wms=self.carica_wms,
+                append_to_layer=self.append_to_layer,
+            )
+        finally:
+            self._download_in_corso = False
 
         qgis_iface.actionPan().trigger()
         if self.on_completed:
@@ -1344,28 +2149,31 @@ class LineSelectTool(QgsMapTool):
         qgis_iface.statusBarIface().clearMessage()
 
     def _aggiorna_rubber_band(self, cursor_point=None):
-        """Aggiorna il rubber band della polilinea in costruzione."""
-        if self._draw_rb:
-            try:
-                self.canvas.scene().removeItem(self._draw_rb)
-            except Exception:
-                pass
-            self._draw_rb = None
-
+        """
+        Aggiorna il rubber band della polilinea in costruzione.
+        Il rubber band viene creato una volta sola per disegno e poi riusato:
+        nessun oggetto nuovo nella scena a ogni movimento del mouse.
+        """
         if len(self._draw_points) < 1:
+            if self._draw_rb:
+                self._draw_rb.reset(_GEOM_LINE)
             return
 
-        self._draw_rb = QgsRubberBand(self.canvas, _GEOM_LINE)
-        self._draw_rb.setColor(QColor(255, 100, 0, 200))
-        self._draw_rb.setWidth(2)
-        self._draw_rb.setLineStyle(_DashLine)
+        if self._draw_rb is None:
+            self._draw_rb = QgsRubberBand(self.canvas, _GEOM_LINE)
+            self._draw_rb.setColor(QColor(255, 100, 0, 200))
+            self._draw_rb.setWidth(2)
+            self._draw_rb.setLineStyle(_DashLine)
 
         points = list(self._draw_points)
         if cursor_point:
             points.append(cursor_point)
+        if len(points) < 2:
+            self._draw_rb.reset(_GEOM_LINE)
+            return
 
-        for pt in points:
-            self._draw_rb.addPoint(pt)
+        # Tutta la polilinea in un solo setToGeometry (un aggiornamento della scena)
+        self._draw_rb.setToGeometry(QgsGeometry.fromPolylineXY(points), None)
         self._draw_rb.show()
 
     def canvasMoveEvent(self, event):
@@ -1376,8 +2184,10 @@ class LineSelectTool(QgsMapTool):
         self._aggiorna_rubber_band(cursor_point)
 
     def canvasPressEvent(self, event):
+        if self._download_in_corso:
+            return
         click_map_point = self.toMapCoordinates(event.pos())
-        project_crs = QgsProject.instance().crs()
+        project_crs = _crs_progetto()
 
         # --- Click destro: termina la polilinea ---
         if event.button() == _RightButton:
@@ -1385,7 +2195,7 @@ class LineSelectTool(QgsMapTool):
                 print(f"\n[LINEA] Polilinea disegnata con {len(self._draw_points)} vertici")
 
                 # Controlla se il CRS è proiettato
-                if project_crs.isGeographic():
+                if _crs_geografico(project_crs):
                     print(f"\n[ERRORE] Il CRS del progetto è geografico "
                           f"({project_crs.authid()}).")
                     QMessageBox.warning(
@@ -1428,37 +2238,36 @@ class LineSelectTool(QgsMapTool):
             return
 
         # --- Prima prova a selezionare una linea esistente ---
-        print(f"\n[DEBUG] Click alle coordinate progetto ({project_crs.authid()}): "
-              f"({click_map_point.x():.6f}, {click_map_point.y():.6f})")
+        # Ignora click ravvicinati (doppio click): la ricerca sui layer è costosa
+        ora = time.monotonic()
+        if ora - self._ultimo_click < DEBOUNCE_CLICK_SECONDI:
+            return
+        self._ultimo_click = ora
 
         # Trova layer lineari
-        line_layers = []
-        for lyr in QgsProject.instance().mapLayers().values():
-            if isinstance(lyr, QgsVectorLayer) and _is_line_layer(lyr):
-                line_layers.append(lyr.name())
-        print(f"[DEBUG] Layer lineari trovati: {line_layers if line_layers else 'NESSUNO'}")
+        line_layers = _layer_vettoriali(_is_line_layer)
+        if DEBUG:
+            print(f"\n[DEBUG] Click alle coordinate progetto ({project_crs.authid()}): "
+                  f"({click_map_point.x():.6f}, {click_map_point.y():.6f})")
+            nomi = [lyr.name() for lyr in line_layers]
+            print(f"[DEBUG] Layer lineari trovati: {nomi if nomi else 'NESSUNO'}")
 
         found = False
-        for layer in QgsProject.instance().mapLayers().values():
-            if not isinstance(layer, QgsVectorLayer):
-                continue
-            if not _is_line_layer(layer):
-                continue
+        for layer in line_layers:
 
             layer_crs = layer.crs()
+            stesso_crs = _stesso_crs(layer_crs, project_crs)
 
             # Trasforma punto click nel CRS del layer
-            if project_crs.authid() != layer_crs.authid():
-                to_layer = QgsCoordinateTransform(
-                    project_crs, layer_crs, QgsProject.instance()
-                )
+            if not stesso_crs:
+                to_layer = _get_xform(project_crs, layer_crs)
                 click_layer_point = to_layer.transform(click_map_point)
             else:
                 click_layer_point = click_map_point
 
             # Crea area di ricerca
             tolerance = self.canvas.mapUnitsPerPixel() * 15
-            if project_crs.authid() != layer_crs.authid():
+            if not stesso_crs:
                 tolerance_layer = tolerance * 2
             else:
                 tolerance_layer = tolerance
@@ -1469,31 +2278,51 @@ class LineSelectTool(QgsMapTool):
                 click_layer_point.x() + tolerance_layer,
                 click_layer_point.y() + tolerance_layer,
             )
+            # Layer lontano dal click: nessuna richiesta di feature (per le linee
+            # conta la tolleranza, un punto appena fuori dall'extent è valido)
+            if not layer.extent().intersects(search_rect):
+                continue
 
-            request = QgsFeatureRequest().setFilterRect(search_rect)
-            click_geom = QgsGeometry.fromPointXY(click_layer_point)
+            # Punto click preparato una volta, riusato per tutti i candidati
+            click_engine = _prepara_geometria(QgsGeometry.fromPointXY(click_layer_point))
 
             # Trova la linea più vicina
             min_distance = float('inf')
             closest_feature = None
             closest_layer = None
 
-            for feat in layer.getFeatures(request):
-                geom = feat.geometry()
-                if geom.isNull() or geom.isEmpty():
-                    continue
-                distance = geom.distance(click_geom)
-                if distance < min_distance:
-                    min_distance = distance
-                    closest_feature = feat
-                    closest_layer = layer
+            if layer.hasSpatialIndex() == Qgis.SpatialIndexPresence.NotPresent:
+                # L'indice in cache conserva le geometrie: nearestNeighbor restituisce
+                # direttamente la linea più vicina entro la tolleranza (solo per
+                # provider senza indice: con presenza sconosciuta, es. WFS, si
+                # scaricherebbe l'intero layer)
+                nn_ids = _indice_spaziale_layer(layer).nearestNeighbor(
+                    click_layer_point, 1, tolerance_layer
+                )
+                if nn_ids:
+                    request = QgsFeatureRequest().setFilterFid(nn_ids[0]).setNoAttributes()
+                    for feat in layer.getFeatures(request):
+                        min_distance = click_engine.distance(feat.geometry().constGet())
+                        closest_feature = feat
+                        closest_layer = layer
+            else:
+                request = _richiesta_feature_nel_rect(layer, search_rect)
+                for feat in layer.getFeatures(request):
+                    geom = feat.geometry()
+                    if geom.isEmpty():
+                        continue
+                    distance = click_engine.distance(geom.constGet())
+                    if distance < min_distance:
+                        min_distance = distance
+                        closest_feature = feat
+                        closest_layer = layer
 
             if closest_feature is not None and min_distance <= tolerance_layer:
                 found = True
                 layer_crs = closest_layer.crs()
 
                 # Controlla se il CRS è proiettato
-                if layer_crs.isGeographic():
+                if _crs_geografico(layer_crs):
                     print(f"\n[ERRORE] Il layer '{closest_layer.name()}' usa un CRS "
                           f"geografico ({layer_crs.authid()}).")
                     print(f"         Per calcolare correttamente il buffer di "
@@ -1515,10 +2344,12 @@ class LineSelectTool(QgsMapTool):
                 feat_id = closest_feature.id()
                 layer_name = closest_layer.name()
 
-                print("\n[LINEA] Linea selezionata:")
-                print(f"                Layer: {layer_name}")
-                print(f"                Feature ID: {feat_id}")
-                print(f"                CRS del layer: {layer_crs.authid()}")
+                print(
+                    "\n[LINEA] Linea selezionata:\n"
+                    f"                Layer: {layer_name}\n"
+                    f"                Feature ID: {feat_id}\n"
+                    f"                CRS del layer: {layer_crs.authid()}"
+                )
 
                 line_geom = closest_feature.geometry()
                 self._esegui_download_da_linea(line_geom, layer_crs)
@@ -1584,7 +2415,7 @@ class PointSelectTool(QgsMapTool):
 
     def __init__(self, canvas, buffer_distance=1, snap_tolerance=15,
                  on_completed=None, espandi_catastale=False, carica_wms=False,
-                 source_layer=None, initial_append_layer=None):
+                 source_layer=None, initial_append_layer=None, esc_shortcut=None):
         super().__init__(canvas)
         self.canvas = canvas
         self.buffer_distance = buffer_distance
@@ -1595,22 +2426,21 @@ class PointSelectTool(QgsMapTool):
         self.on_completed = on_completed
         self.source_layer = source_layer
         self._session_layer = initial_append_layer
-        self._esc_shortcut = None
+        # Scorciatoia ESC del plugin (unica sul canvas): qui solo abilitata/collegata
+        self._esc_shortcut = esc_shortcut
 
     def activate(self):
         super().activate()
-        self._esc_shortcut = QShortcut(
-            QKeySequence(_Key_Escape), self.canvas
-        )
-        try:
-            ctx = Qt.ShortcutContext.WidgetWithChildrenShortcut
-        except AttributeError:
-            ctx = Qt.WidgetWithChildrenShortcut
-        self._esc_shortcut.setContext(ctx)
-        self._esc_shortcut.activated.connect(self._on_esc)
+        if self._esc_shortcut is not None:
+            self._esc_shortcut.activated.connect(self._on_esc)
+            self._esc_shortcut.setEnabled(True)
         # Se è stato preimpostato un layer sorgente, elaboralo subito
         if self.source_layer is not None:
-            QTimer.singleShot(100, lambda: self._processa_layer_punti(self.source_layer))
+            QTimer.singleShot(100, self._avvio_automatico)
+
+    def _avvio_automatico(self):
+        """Avvia l'elaborazione del layer sorgente preimpostato."""
+        self._processa_layer_punti(self.source_layer)
 
     def _on_esc(self):
         """Gestisce ESC: termina la sessione click singolo."""
@@ -1620,25 +2450,18 @@ class PointSelectTool(QgsMapTool):
             self.on_completed()
 
     def _visualizza_buffer(self, buffer_geom, buffer_crs):
-        """Visualizza il buffer dissolto sulla mappa (viola)."""
-        if self.buffer_rb:
-            self.canvas.scene().removeItem(self.buffer_rb)
-            self.buffer_rb = None
-
-        project_crs = QgsProject.instance().crs()
-        if buffer_crs.authid() != project_crs.authid():
-            transform = QgsCoordinateTransform(
-                buffer_crs, project_crs, QgsProject.instance()
-            )
-            buffer_geom_proj = QgsGeometry(buffer_geom)
-            buffer_geom_proj.transform(transform)
-        else:
-            buffer_geom_proj = buffer_geom
-
-        self.buffer_rb = QgsRubberBand(self.canvas, _GEOM_POLYGON)
-        self.buffer_rb.setColor(QColor(123, 31, 162, 60))
-        self.buffer_rb.setStrokeColor(QColor(123, 31, 162, 200))
-        self.buffer_rb.setWidth(2)
+        """
+        Visualizza il buffer dissolto sulla mappa (viola). Il rubberband viene
+        creato al primo click e riusato per i successivi (rimosso in deactivate).
+        """
+        project_crs = _crs_progetto()
+        buffer_geom_proj = _geometria_in_crs(buffer_geom, buffer_crs, project_crs)
+
+        if self.buffer_rb is None:
+            self.buffer_rb = QgsRubberBand(self.canvas, _GEOM_POLYGON)
+            self.buffer_rb.setColor(QColor(123, 31, 162, 60))
+            self.buffer_rb.setStrokeColor(QColor(123, 31, 162, 200))
+            self.buffer_rb.setWidth(2)
         self.buffer_rb.setToGeometry(buffer_geom_proj, None)
         self.buffer_rb.show()
 
@@ -1657,7 +2480,7 @@ class PointSelectTool(QgsMapTool):
             return
 
         click_map_point = self.toMapCoordinates(event.pos())
-        project_crs = QgsProject.instance().crs()
+        project_crs = _crs_progetto()
         print(f"\n[PUNTI] Click mappa ({project_crs.authid()}): "
               f"({click_map_point.x():.6f}, {click_map_point.y():.6f})")
         self._processa_click_singolo(click_map_point, project_crs)
@@ -1688,19 +2511,20 @@ class PointSelectTool(QgsMapTool):
                 return
 
             # Usa i punti selezionati se disponibili, altrimenti tutti
+            # (servono solo le geometrie: nessun attributo richiesto al provider)
+            request = QgsFeatureRequest().setNoAttributes()
             if n_selected > 0:
-                features = layer.selectedFeatures()
+                features = layer.getSelectedFeatures(request)
                 print(f"[PUNTI] Uso {n_selected} punti selezionati")
             else:
-                features = layer.getFeatures()
+                features = layer.getFeatures(request)
                 print(f"[PUNTI] Nessuna selezione, uso tutti i {n_features} punti")
 
-            all_points = []
-            for feat in features:
-                geom = feat.geometry()
-                if geom.isNull() or geom.isEmpty():
-                    continue
-                all_points.append(geom)
+            # isEmpty() è vero anche per le geometrie nulle
+            all_points = [
+                geom for geom in (feat.geometry() for feat in features)
+                if not geom.isEmpty()
+            ]
 
             if not all_points:
                 QMessageBox.warning(
@@ -1710,53 +2534,47 @@ class PointSelectTool(QgsMapTool):
                 )
                 return
 
-            print(f"[PUNTI] Punti validi: {len(all_points)}")
+            n_punti = len(all_points)
+            print(f"[PUNTI] Punti validi: {n_punti}")
+
+            # Tutti i punti in una sola MultiPoint nel CRS del layer, riusata per
+            # centroide, buffer e post-filtro (una trasformazione per CRS di arrivo).
+            # La lista delle singole geometrie non serve più: si libera subito
+            punti_layer = QgsGeometry.collectGeometry(all_points)
+            del all_points
 
             # Determina CRS di lavoro per il buffer
             if layer_crs.isGeographic():
                 print(f"[PUNTI] CRS geografico rilevato ({layer_crs.authid()}).")
                 print("        Auto-riproiezione in zona UTM...")
 
-                # Calcola centroide medio per determinare zona UTM
-                sum_x, sum_y = 0.0, 0.0
-                for pt_geom in all_points:
-                    centroid = pt_geom.centroid().asPoint()
-                    sum_x += centroid.x()
-                    sum_y += centroid.y()
-                avg_lon = sum_x / len(all_points)
-                avg_lat = sum_y / len(all_points)
+                # Centroide medio per determinare zona UTM: il centroide di una
+                # MultiPoint è la media delle coordinate dei suoi punti
+                centroide = punti_layer.centroid().asPoint()
+                avg_lon = centroide.x()
+                avg_lat = centroide.y()
 
                 utm_epsg = _determina_utm_epsg(avg_lon, avg_lat)
                 buffer_crs = QgsCoordinateReferenceSystem(utm_epsg)
                 print(f"        Centroide punti: ({avg_lon:.6f}, {avg_lat:.6f})")
                 print(f"        Zona UTM scelta: {utm_epsg}")
 
-                # Riproietta punti in UTM per il buffer
-                transform_to_utm = QgsCoordinateTransform(
-                    layer_crs, buffer_crs, QgsProject.instance()
-                )
-                points_for_buffer = []
-                for pt_geom in all_points:
-                    pt_utm = QgsGeometry(pt_geom)
-                    pt_utm.transform(transform_to_utm)
-                    points_for_buffer.append(pt_utm)
+                # Riproietta punti in UTM per il buffer: una sola chiamata
+                # di trasformazione su tutte le coordinate
+                points_for_buffer = _geometria_in_crs(punti_layer, layer_crs, buffer_crs)
             else:
                 buffer_crs = layer_crs
-                points_for_buffer = all_points
+                points_for_buffer = punti_layer
                 print(f"[PUNTI] CRS proiettato ({layer_crs.authid()}), "
                       "nessuna riproiezione necessaria.")
 
-            # Buffer individuale + Dissolve
+            # Buffer + Dissolve in un solo passo: il buffer della MultiPoint
+            # è già l'unione dei cerchi attorno ai singoli punti
             print(f"[PUNTI] Creazione buffer di {self.buffer_distance}m "
-                  f"per {len(points_for_buffer)} punti...")
-
-            buffer_geoms = []
-            for pt_geom in points_for_buffer:
-                buf = pt_geom.buffer(self.buffer_distance, 8)
-                if not buf.isNull() and not buf.isEmpty():
-                    buffer_geoms.append(buf)
+                  f"per {n_punti} punti...")
 
-            if not buffer_geoms:
+            dissolved = points_for_buffer.buffer(self.buffer_distance, 8)
+            if dissolved.isNull() or dissolved.isEmpty():
                 QMessageBox.warning(
                     qgis_iface.mainWindow(),
                     "Errore buffer",
@@ -1764,15 +2582,6 @@ class PointSelectTool(QgsMapTool):
                 )
                 return
 
-            dissolved = QgsGeometry.unaryUnion(buffer_geoms)
-            if dissolved.isNull() or dissolved.isEmpty():
-                QMessageBox.warning(
-                    qgis_iface.mainWindow(),
-                    "Errore dissolve",
-                    "Impossibile dissolvere i buffer.",
-                )
-                return
-
             print("[PUNTI] Buffer dissolto creato.")
             print(f"        Area dissolve: ~{dissolved.area():.1f} m²")
 
@@ -1789,28 +2598,13 @@ class PointSelectTool(QgsMapTool):
                 bbox, buffer_crs
             )
 
-            wfs_crs = QgsCoordinateReferenceSystem(WFS_CRS_ID)
-            if buffer_crs.authid() != wfs_crs.authid():
-                transform_to_wfs = QgsCoordinateTransform(
-                    buffer_crs, wfs_crs, QgsProject.instance()
-                )
-                dissolved_wfs = QgsGeometry(dissolved)
-                dissolved_wfs.transform(transform_to_wfs)
-            else:
-                dissolved_wfs = dissolved
+            wfs_crs = _WFS_CRS
+            dissolved_wfs = _geometria_in_crs(dissolved, buffer_crs, wfs_crs)
 
-            # Trasforma punti originali in WFS CRS per post-filtro
-            wfs_points = []
-            if layer_crs.authid() != wfs_crs.authid():
-                transform_pts_to_wfs = QgsCoordinateTransform(
-                    layer_crs, wfs_crs, QgsProject.instance()
-                )
-                for pt_geom in all_points:
-                    pt_wfs = QgsGeometry(pt_geom)
-                    pt_wfs.transform(transform_pts_to_wfs)
-                    wfs_points.append(pt_wfs)
-            else:
-                wfs_points = list(all_points)
+            # Trasforma punti originali in WFS CRS per post-filtro (in blocco,
+            # come MultiPoint: il post-filtro li riunisce comunque in una sola geometria)
+            punti_wfs = _geometria_in_crs(punti_layer, layer_crs, wfs_crs)
+            wfs_points = [punti_wfs]
 
             # Download WFS con filtro
             result_layer = esegui_download_e_caricamento(
@@ -1845,11 +2639,7 @@ class PointSelectTool(QgsMapTool):
             buffer_crs = QgsCoordinateReferenceSystem(utm_epsg)
             print(f"[PUNTI] Auto-riproiezione click in {utm_epsg}")
 
-            transform_to_utm = QgsCoordinateTransform(
-                click_crs, buffer_crs, QgsProject.instance()
-            )
-            pt_utm = QgsGeometry(pt_geom)
-            pt_utm.transform(transform_to_utm)
+            pt_utm = _geometria_in_crs(pt_geom, click_crs, buffer_crs)
         else:
             buffer_crs = click_crs
             pt_utm = pt_geom
@@ -1864,25 +2654,11 @@ class PointSelectTool(QgsMapTool):
             bbox, buffer_crs
         )
 
-        wfs_crs = QgsCoordinateReferenceSystem(WFS_CRS_ID)
-        if buffer_crs.authid() != wfs_crs.authid():
-            transform_to_wfs = QgsCoordinateTransform(
-                buffer_crs, wfs_crs, QgsProject.instance()
-            )
-            buffer_wfs = QgsGeometry(buffer_geom)
-            buffer_wfs.transform(transform_to_wfs)
-        else:
-            buffer_wfs = buffer_geom
+        wfs_crs = _WFS_CRS
+        buffer_wfs = _geometria_in_crs(buffer_geom, buffer_crs, wfs_crs)
 
         # Punto originale in WFS CRS per post-filtro
-        if click_crs.authid() != wfs_crs.authid():
-            transform_pt_wfs = QgsCoordinateTransform(
-                click_crs, wfs_crs, QgsProject.instance()
-            )
-            pt_wfs = QgsGeometry(pt_geom)
-            pt_wfs.transform(transform_pt_wfs)
-        else:
-            pt_wfs = pt_geom
+        pt_wfs = _geometria_in_crs(pt_geom, click_crs, wfs_crs)
 
         result_layer = esegui_download_e_caricamento(
             min_lat, min_lon, max_lat, max_lon,
@@ -1897,10 +2673,12 @@ class PointSelectTool(QgsMapTool):
             self._session_layer = result_layer
 
     def deactivate(self):
-        if self._esc_shortcut:
+        if self._esc_shortcut is not None:
             self._esc_shortcut.setEnabled(False)
-            self._esc_shortcut.deleteLater()
-            self._esc_shortcut = None
+            try:
+                self._esc_shortcut.activated.disconnect(self._on_esc)
+            except TypeError:
+                pass
         if self.buffer_rb:
             try:
                 self.canvas.scene().removeItem(self.buffer_rb)
@@ -1927,6 +2705,7 @@ class WfsCatastoDownloadParticelleBbox:
         self._active_tool = None
         self._avviso_accettato = False
         self._dlg = None
+        self._esc_shortcut = None
 
     def initGui(self):
         """Crea azioni nella toolbar e nel menu Plugin."""
@@ -1990,11 +2769,36 @@ class WfsCatastoDownloadParticelleBbox:
         QgsExpression.registerFunction(get_particella_info)
         print("[OK] Funzione personalizzata 'get_particella_info' registrata")
 
+        # Le trasformazioni e il CRS in cache dipendono dal progetto corrente
+        QgsProject.instance().crsChanged.connect(_svuota_cache_trasformazioni)
+        QgsProject.instance().transformContextChanged.connect(_svuota_cache_trasformazioni)
+        QgsProject.instance().cleared.connect(_svuota_cache_trasformazioni)
+
+        # ESC per il tool punti: una sola scorciatoia sul canvas, disabilitata
+        # finché il tool non la attiva
+        self._esc_shortcut = QShortcut(QKeySequence(_Key_Escape), self.iface.mapCanvas())
+        self._esc_shortcut.setContext(_WidgetWithChildrenShortcut)
+        self._esc_shortcut.setEnabled(False)
+
     def unload(self):
         """Rimuove azioni dalla toolbar e dal menu."""
         # Deregistra la funzione personalizzata
         QgsExpression.unregisterFunction('get_particella_info')
         print("[OK] Funzione personalizzata 'get_particella_info' deregistrata")
+
+        try:
+            QgsProject.instance().crsChanged.disconnect(_svuota_cache_trasformazioni)
+            QgsProject.instance().transformContextChanged.disconnect(_svuota_cache_trasformazioni)
+            QgsProject.instance().cleared.disconnect(_svuota_cache_trasformazioni)
+        except TypeError:
+            pass
+        _svuota_cache_trasformazioni()
+        _svuota_cache_indici_spaziali()
+
+        if self._esc_shortcut is not None:
+            self._esc_shortcut.setEnabled(False)
+            self._esc_shortcut.deleteLater()
+            self._esc_shortcut = None
         
         for action in self.actions:
             self.iface.removePluginMenu(self.menu, action)
@@ -2019,6 +2823,8 @@ class WfsCatastoDownloadParticelleBbox:
         self._dlg.show()
         self._dlg.raise_()
         self._dlg.activateWindow()
+        # Pipeline PROJ preparate mentre l'utente sceglie la modalità
+        QTimer.singleShot(0, _precarica_trasformazioni)
 
     def _on_modalita_scelta(self):
         """Callback quando l'utente sceglie una modalità dal dialog."""
@@ -2029,13 +2835,16 @@ class WfsCatastoDownloadParticelleBbox:
         append_globale = dlg.output_globale_layer
 
         if dlg.scelta == "disegna":
-            print("\n  MODALITÀ: Disegna BBox")
-            print("  >>> Clicca sulla mappa per il PRIMO angolo")
-            print("  >>> Muovi il mouse per l'anteprima")
-            print("  >>> Clicca per il SECONDO angolo")
-            print("  >>> Il download partirà automaticamente\n")
+            righe = [
+                "\n  MODALITÀ: Disegna BBox",
+                "  >>> Clicca sulla mappa per il PRIMO angolo",
+                "  >>> Muovi il mouse per l'anteprima",
+                "  >>> Clicca per il SECONDO angolo",
+                "  >>> Il download partirà automaticamente\n",
+            ]
             if append_globale is not None:
-                print(f"  >>> Output globale: aggiungi a '{append_globale.name()}'\n")
+                righe.append(f"  >>> Output globale: aggiungi a '{append_globale.name()}'\n")
+            print("\n".join(righe))
             tool = BBoxDrawTool(canvas, on_completed=self._reopen_dialog,
                                 espandi_catastale=espandi, carica_wms=wms,
                                 append_to_layer=append_globale)
@@ -2043,12 +2852,15 @@ class WfsCatastoDownloadParticelleBbox:
             self._active_tool = tool
 
         elif dlg.scelta == "poligono":
-            print("\n  MODALITÀ: Seleziona Poligono")
-            print("  >>> Clicca su un poligono nella mappa")
-            print("  >>> Il bbox verrà estratto e il CRS verificato")
-            print("  >>> Il download partirà automaticamente\n")
+            righe = [
+                "\n  MODALITÀ: Seleziona Poligono",
+                "  >>> Clicca su un poligono nella mappa",
+                "  >>> Il bbox verrà estratto e il CRS verificato",
+                "  >>> Il download partirà automaticamente\n",
+            ]
             if append_globale is not None:
-                print(f"  >>> Output globale: aggiungi a '{append_globale.name()}'\n")
+                righe.append(f"  >>> Output globale: aggiungi a '{append_globale.name()}'\n")
+            print("\n".join(righe))
             tool = PolySelectTool(canvas, on_completed=self._reopen_dialog,
                                   espandi_catastale=espandi, carica_wms=wms,
                                   append_to_layer=append_globale)
@@ -2057,13 +2869,16 @@ class WfsCatastoDownloadParticelleBbox:
 
         elif dlg.scelta == "asse":
             buffer_m = dlg.buffer_distance
-            print("\n  MODALITÀ: Seleziona Linea")
-            print("  >>> Clicca su una linea nella mappa")
-            print(f"  >>> Verrà creato un buffer di {buffer_m}m")
-            print("  >>> Verranno scaricate solo le particelle che intersecano il buffer")
-            print("  >>> ATTENZIONE: Il layer deve avere un CRS proiettato (metri)\n")
+            righe = [
+                "\n  MODALITÀ: Seleziona Linea",
+                "  >>> Clicca su una linea nella mappa",
+                f"  >>> Verrà creato un buffer di {buffer_m}m",
+                "  >>> Verranno scaricate solo le particelle che intersecano il buffer",
+                "  >>> ATTENZIONE: Il layer deve avere un CRS proiettato (metri)\n",
+            ]
             if append_globale is not None:
-                print(f"  >>> Output globale: aggiungi a '{append_globale.name()}'\n")
+                righe.append(f"  >>> Output globale: aggiungi a '{append_globale.name()}'\n")
+            print("\n".join(righe))
             tool = LineSelectTool(canvas, buffer_distance=buffer_m,
                                   on_completed=self._reopen_dialog,
                                   espandi_catastale=espandi, carica_wms=wms,
@@ -2076,24 +2891,26 @@ class WfsCatastoDownloadParticelleBbox:
             snap_px = dlg.snap_tolerance
             source_lyr = dlg.selected_point_layer
             append_lyr = dlg.append_to_wfs_layer
-            print("\n  MODALITÀ: Seleziona Punti")
+            righe = ["\n  MODALITÀ: Seleziona Punti"]
             if source_lyr is not None:
-                print(f"  >>> Layer sorgente: {source_lyr.name()}")
+                righe.append(f"  >>> Layer sorgente: {source_lyr.name()}")
             else:
-                print("  >>> Clicca vicino a un punto in mappa")
-            print(f"  >>> Verrà creato un buffer di {buffer_m}m per ogni punto del layer")
-            print(f"  >>> Tolleranza snap: {snap_px} px")
+                righe.append("  >>> Clicca vicino a un punto in mappa")
+            righe.append(f"  >>> Verrà creato un buffer di {buffer_m}m per ogni punto del layer")
+            righe.append(f"  >>> Tolleranza snap: {snap_px} px")
             if append_lyr is not None:
-                print(f"  >>> Aggiungi a layer esistente: {append_lyr.name()}")
+                righe.append(f"  >>> Aggiungi a layer esistente: {append_lyr.name()}")
             else:
-                print("  >>> Verrà creato un nuovo layer")
-            print("  >>> CRS geografico supportato (auto-riproiezione UTM)\n")
+                righe.append("  >>> Verrà creato un nuovo layer")
+            righe.append("  >>> CRS geografico supportato (auto-riproiezione UTM)\n")
+            print("\n".join(righe))
             tool = PointSelectTool(canvas, buffer_distance=buffer_m,
                                    snap_tolerance=snap_px,
                                    on_completed=self._reopen_dialog,
                                    espandi_catastale=espandi, carica_wms=wms,
                                    source_layer=source_lyr,
-                                   initial_append_layer=append_lyr)
+                                   initial_append_layer=append_lyr,
+                                   esc_shortcut=self._esc_shortcut)
             canvas.setMapTool(tool)
             self._active_tool = tool
 